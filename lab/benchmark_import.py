@@ -0,0 +1,64 @@
+"""
+Time `import hindkit` in fresh interpreters, and fail (exit status 1) if it pulls in heavy modules or goes over budget.
+
+    python lab/benchmark_import.py [budget in milliseconds]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+BUDGET = float(sys.argv[1]) if len(sys.argv) > 1 else 150  # milliseconds
+RUNS = 10
+
+HEAVY_MODULES = [
+    "defcon",
+    "fontTools.ttLib",
+    "ufo2ft",
+    "mutatorMath",
+    "fontMath",
+    "numpy",
+    "afdko",
+    "WriteFeaturesKernFDK",
+    "WriteFeaturesMarkFDK",
+    "getKerningPairsFromFEA",
+]
+
+CODE = """
+import sys, time
+start = time.perf_counter()
+import hindkit
+hindkit.constants.get_u_scalar_to_u_name()["0915"]
+print((time.perf_counter() - start) * 1000)
+print(" ".join(sys.modules))
+"""
+
+environment = dict(os.environ)
+environment["PYTHONPATH"] = os.pathsep.join(
+    [os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib")] +
+    [i for i in [environment.get("PYTHONPATH")] if i]
+)
+
+times = []
+for _ in range(RUNS):
+    output = subprocess.check_output([sys.executable, "-c", CODE], env=environment, universal_newlines=True)
+    milliseconds, module_names = output.splitlines()
+    times.append(float(milliseconds))
+    module_names = module_names.split()
+
+imported_heavy_modules = [i for i in HEAVY_MODULES if i in module_names]
+median = statistics.median(times)
+
+print("[IMPORT TIME] median {:.1f} ms, min {:.1f} ms, max {:.1f} ms over {} runs (budget {:.0f} ms)".format(
+    median, min(times), max(times), RUNS, BUDGET,
+))
+
+failed = False
+if imported_heavy_modules:
+    print("[FAILED] Heavy modules imported:", " ".join(imported_heavy_modules))
+    failed = True
+if median > BUDGET:
+    print("[FAILED] Over budget.")
+    failed = True
+sys.exit(1 if failed else 0)
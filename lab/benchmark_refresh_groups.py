@@ -0,0 +1,49 @@
+import contextlib
+import io
+import random
+import time
+
+import defcon
+
+import hindkit as k
+
+GLYPH_COUNT = 4000
+GROUP_COUNT = 400
+PAIR_COUNTS = [5000, 10000, 20000, 40000, 80000]
+
+def get_font(pair_count):
+    random.seed(pair_count)
+    font = defcon.Font()
+    glyph_names = ["g{}".format(i) for i in range(GLYPH_COUNT)]
+    for glyph_name in glyph_names:
+        font.newGlyph(glyph_name)
+    group_names = []
+    for i in range(GROUP_COUNT):
+        side = i % 2 + 1
+        group_name = "public.kern{}.group{}".format(side, i)
+        font.groups[group_name] = random.sample(glyph_names, 10)
+        group_names.append((side, group_name))
+    kerning = {}
+    while len(kerning) < pair_count:
+        sides = []
+        for side in [1, 2]:
+            if random.random() < 0.3:
+                sides.append(random.choice([n for s, n in group_names if s == side]))
+            else:
+                sides.append(random.choice(glyph_names))
+        kerning[tuple(sides)] = random.randint(-100, 100)
+    font.kerning.update(kerning)
+    return font
+
+def measure(pair_count):
+    style = k.Style(None, name="Benchmark")
+    style.defconFont = get_font(pair_count)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        style.refresh_groups()
+    return time.perf_counter() - start, len(style.defconFont.kerning)
+
+print("pairs\tkept\tseconds\tmicroseconds per pair")
+for pair_count in PAIR_COUNTS:
+    seconds, kept = measure(pair_count)
+    print("{}\t{}\t{:.3f}\t{:.2f}".format(pair_count, kept, seconds, seconds / pair_count * 1e6))
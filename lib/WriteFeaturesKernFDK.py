@@ -10,6 +10,8 @@ kDefaultWriteTrimmed = False  #if 'False', trimmed pairs will not be processed a
 					  #for a different default behavior change the value to 'True'.
 kDefaultWriteSubtables = True
 
+kSortRunLength = 50000  # Sorted runs longer than this are spilled to temporary files and merged.
+
 kLeftTag = ['_LEFT','_1ST', '_L_']
 kRightTag = ['_RIGHT','_2ND', '_R_']
 
@@ -137,10 +139,11 @@ v3.4   - Jan 22 2014 - Fixed the sorting of group-glyph pairs; they must be plac
 v3.5   - Jan 27 2014 - Skip the pairs involving groups that have a value of zero; retaining these pairs has no impact on LTR kerning, but it's damaging for RTL kerning because zero value pairs trigger the start of a new subtable.
 v3.6   - Apr 02 2014 - Write only classes involved in kerning.
 v3.7   - Oct 12 2015 - Make it work with defcon's ufo3 branch.
+v3.8   -             - Stream the output to the file; sort long pair lists in runs merged from temporary files.
 
 """
 
-import os, time, itertools
+import os, time, itertools, heapq, tempfile
 
 
 class WhichApp(object):
@@ -320,9 +323,8 @@ class KernDataClass(object):
 
 		self.processKerningPairs()
 		self.findExceptions()
-		self.makeOutput()
-		self.sanityCheck()
 		self.writeDataToFile()
+		self.sanityCheck()
 
 
 	def stripPublicPrefix(self, kerningDict):
@@ -483,14 +485,14 @@ class KernDataClass(object):
 		return ll, rl
 
 
-	def dict2pos(self, dictionary, min=0, enum=False, RTL=False):
+	def iterPos(self, dictionary, min=0, enum=False, RTL=False):
 		'''
-		Turns a dictionary to a list of kerning pairs. In a single master font, the function
+		Yields the kerning pairs of a dictionary as sorted lines. In a single master font, the function
 		can filter kerning pairs whose absolute value does not exceed a given threshold.
+		Long lists are sorted in runs which are spilled to temporary files, then merged.
 		'''
-		data = []
-
-		trimmed = 0
+		runs = []
+		run = []
 
 		for pair in dictionary:
 
@@ -502,27 +504,55 @@ class KernDataClass(object):
 				valueString = kernValue
 
 			string =  'pos %s %s;' % (' '.join(pair), valueString)
-			enumstring = 'enum %s' % string
 
 			if self.MM: # no filtering happening in MM.
-				data.append(string)
+				run.append(string)
 
 			elif enum:
-				data.append(enumstring)
+				run.append('enum %s' % string)
 
 			else:
 				if abs(kernValue) < min:
 					if self.writeTrimmed:
-						data.append('# %s' % string)
-					trimmed += 1
+						run.append('# %s' % string)
+					self.trimmedPairs += 1
 
 				else:
-					data.append(string)
+					run.append(string)
+
+			if len(run) >= kSortRunLength:
+				runs.append(self.spillRun(run))
+				run = []
+
+		run.sort()
+		if not runs:
+			for line in run:
+				yield line
+			return
 
-		self.trimmedPairs += trimmed
-		data.sort()
+		runs.append(self.spillRun(run))
+		try:
+			for line in heapq.merge(*[(line[:-1] for line in f) for f in runs]):
+				yield line
+		finally:
+			for f in runs:
+				f.close()
 
-		return '\n'.join(data)
+
+	def spillRun(self, run):
+		'Writes a run of lines, sorted, to a temporary file; and returns the file, ready for reading.'
+		run.sort()
+		f = tempfile.TemporaryFile(mode='w+')
+		for line in run:
+			f.write(line)
+			f.write('\n')
+		f.seek(0)
+		return f
+
+
+	def dict2pos(self, dictionary, min=0, enum=False, RTL=False):
+		'Turns a dictionary to a string of sorted kerning pairs.'
+		return '\n'.join(self.iterPos(dictionary, min, enum, RTL))
 
 
 	def analyzeGroups(self):
@@ -589,13 +619,18 @@ class KernDataClass(object):
 	def findExceptions(self):
 		'Process lists (glyph_group, group_group etc.) created above to find out which pairs are exceptions, and which are just normal pairs'
 
+		# Sets for constant-time membership tests:
+		groupedLeft = set(self.grouped_left)
+		groupedRight = set(self.grouped_right)
+		glyphGlyphPairs = set(self.glyph_glyph)
+
 		# glyph to group pairs:
 		# ---------------------
 
 		for (g, gr) in self.glyph_group:
 			isRTLpair = self.checkForRTL((g, gr))
 			group = self.groups[gr]
-			if g in self.grouped_left:
+			if g in groupedLeft:
 				# it is a glyph_to_group exception!
 				if isRTLpair:
 					self.RTLglyph_group_exceptions_dict[g, gr] = '<%s 0 %s 0>' % (self.kerning[g, gr], self.kerning[g, gr])
@@ -604,30 +639,34 @@ class KernDataClass(object):
 			else:
 				for i in group:
 					pair = (g, i)
-					if pair in self.glyph_glyph:
+					if pair in glyphGlyphPairs:
 						# that pair is a glyph_to_glyph exception!
 						if isRTLpair:
 							self.RTLglyph_glyph_exceptions_dict[pair] = '<%s 0 %s 0>' % (self.kerning[pair], self.kerning[pair])
 						else:
 							self.glyph_glyph_exceptions_dict[pair] = self.kerning[pair]
 
-				else:
-					# skip the pair if the value is zero
-					if self.kerning[g, gr] == 0:
-						self.notProcessed += 1
-						continue
+				# skip the pair if the value is zero
+				if self.kerning[g, gr] == 0:
+					self.notProcessed += 1
+					continue
 
-					if isRTLpair:
-						self.RTLglyph_group_dict[g, gr] = '<%s 0 %s 0>' % (self.kerning[g, gr], self.kerning[g, gr])
-					else:
-						self.glyph_group_dict[g, gr] = self.kerning[g, gr]
+				if isRTLpair:
+					self.RTLglyph_group_dict[g, gr] = '<%s 0 %s 0>' % (self.kerning[g, gr], self.kerning[g, gr])
+				else:
+					self.glyph_group_dict[g, gr] = self.kerning[g, gr]
 
 
 		# group to group pairs:
 		# ---------------------
 
-		explodedPairList = []
-		RTLexplodedPairList = []
+		# Instead of exploding every class-to-class pair into all its glyph pairs, the glyphs of the
+		# classes kerned are indexed to the classes (or single right glyph) they belong to, and each
+		# glyph-to-glyph pair is looked up in that index.
+		leftGlyphToGroups = {}
+		rightGlyphToSides = {}
+		classPairs = set()
+		RTLclassPairs = set()
 		for (lgr, rgr) in self.group_group:
 			isRTLpair = self.checkForRTL((lgr, rgr))
 			lgroup = self.groups[lgr]
@@ -636,7 +675,7 @@ class KernDataClass(object):
 				rgroup = self.groups[rgr]
 
 			except KeyError: # Because group-glyph pairs are included in the group-group bucket, the right-side element of the pair may not be a group
-				if rgr in self.grouped_right:
+				if rgr in groupedRight:
 					# it is a group_to_glyph exception!
 					if isRTLpair:
 						self.RTLgroup_glyph_exceptions_dict[lgr, rgr] = '<%s 0 %s 0>' % (self.kerning[lgr, rgr], self.kerning[lgr, rgr])
@@ -645,7 +684,7 @@ class KernDataClass(object):
 					continue # it's an exception, so move on to the next pair
 
 				else:
-					rgroup = rgr
+					rgroup = [rgr] # a single glyph, not the characters of its name
 
 			# skip the pair if the value is zero
 			if self.kerning[lgr, rgr] == 0:
@@ -654,16 +693,30 @@ class KernDataClass(object):
 
 			if isRTLpair:
 				self.RTLgroup_group_dict[lgr, rgr] = '<%s 0 %s 0>' % (self.kerning[lgr, rgr], self.kerning[lgr, rgr])
-				RTLexplodedPairList.extend(self.explode(lgroup, rgroup))
+				RTLclassPairs.add((lgr, rgr))
 			else:
 				self.group_group_dict[lgr, rgr] = self.kerning[lgr, rgr]
-				explodedPairList.extend(self.explode(lgroup, rgroup))
-				# list of all possible pair combinations for the @class @class kerning pairs of the font.
-
-		exceptionPairs = set.intersection(set(explodedPairList), set(self.glyph_glyph))
-		RTLexceptionPairs = set.intersection(set(RTLexplodedPairList), set(self.glyph_glyph))
-		# Finds the intersection of the exploded pairs with the glyph_glyph pairs collected above.
-		# Those must be exceptions, as they occur twice (once in class-kerning, once as a single pair).
+				classPairs.add((lgr, rgr))
+			for lg in lgroup:
+				leftGlyphToGroups.setdefault(lg, set()).add(lgr)
+			for rg in rgroup:
+				rightGlyphToSides.setdefault(rg, set()).add(rgr)
+
+		# Glyph pairs covered by class kerning must be exceptions, as they occur twice (once in class-kerning, once as a single pair).
+		exceptionPairs = set()
+		RTLexceptionPairs = set()
+		for pair in glyphGlyphPairs:
+			lg, rg = pair
+			leftGroups = leftGlyphToGroups.get(lg)
+			rightSides = rightGlyphToSides.get(rg)
+			if not leftGroups or not rightSides:
+				continue
+			for lgr in leftGroups:
+				for rgr in rightSides:
+					if (lgr, rgr) in classPairs:
+						exceptionPairs.add(pair)
+					if (lgr, rgr) in RTLclassPairs:
+						RTLexceptionPairs.add(pair)
 
 
 		for pair in exceptionPairs:
@@ -726,7 +779,7 @@ class KernDataClass(object):
 			if len(dictName):
 				self.processedPairs += len(dictName)
 				self.output.append(comment)
-				self.output.append(self.dict2pos(dictName, minKern, enum))
+				self.output.extend(self.iterPos(dictName, minKern, enum))
 
 
 		if self.writeSubtables:
@@ -747,7 +800,7 @@ class KernDataClass(object):
 					if subtablesCreated > 1:
 						self.output.append( self.subtbBreak )
 
-					self.output.append( self.dict2pos(table, self.minKern) )
+					self.output.extend( self.iterPos(table, self.minKern) )
 
 
 			# class-class subtables
@@ -763,7 +816,7 @@ class KernDataClass(object):
 					if subtablesCreated > 1:
 						self.output.append( self.subtbBreak )
 
-					self.output.append( self.dict2pos(table, self.minKern) )
+					self.output.extend( self.iterPos(table, self.minKern) )
 
 
 		# ------------------
@@ -804,7 +857,7 @@ class KernDataClass(object):
 				if len(dictName):
 					self.processedPairs += len(dictName)
 					self.output.append(comment)
-					self.output.append( self.dict2pos(dictName, minKern, enum, RTL=True) )
+					self.output.extend( self.iterPos(dictName, minKern, enum, RTL=True) )
 
 
 		if RTLpairsExist and self.writeSubtables:
@@ -823,7 +876,7 @@ class KernDataClass(object):
 					if RTLsubtablesCreated > 1:
 						self.output.append( self.subtbBreak )
 
-					self.output.append( self.dict2pos(table, self.minKern, RTL=True) )
+					self.output.extend( self.iterPos(table, self.minKern, RTL=True) )
 
 
 			# RTL class-class subtables
@@ -840,7 +893,7 @@ class KernDataClass(object):
 						# This would happen when both Arabic and Hebrew glyphs are present in one font.
 						self.output.append( self.subtbBreak )
 
-					self.output.append( self.dict2pos(table, self.minKern, RTL=True) )
+					self.output.extend( self.iterPos(table, self.minKern, RTL=True) )
 
 
 		if RTLpairsExist:
@@ -865,22 +918,58 @@ class KernDataClass(object):
 			kKernFeatureFile = self.fileName
 
 		print('\tSaving %s file...' % kKernFeatureFile)
-		if self.trimmedPairs > 0:
-			print('\tTrimmed pairs: %s' % self.trimmedPairs)
 
 		filePath = os.path.join(self.folder, kKernFeatureFile)
 
 		outfile = open(filePath, 'w')
 		outfile.write('\n'.join(self.header))
 		outfile.write('\n\n')
-		if len(self.output):
-			outfile.write('\n'.join(self.output))
-			outfile.write('\n')
+		self.output = OutputStream(outfile)
+		self.makeOutput()
+		self.output.close()
 		outfile.close()
+
+		if self.trimmedPairs > 0:
+			print('\tTrimmed pairs: %s' % self.trimmedPairs)
 		if not self.inFL: print('\tOutput file written to %s' % filePath)
 
 
 
+class OutputStream(object):
+	'''
+	Writes output entries straight to a file, separated by line breaks, instead of collecting them in a list.
+	An entry can be a string, or the lines of an iterable (see iterPos).
+	'''
+	def __init__(self, f):
+		self.f = f
+		self.entryCount = 0
+
+	def __len__(self):
+		return self.entryCount
+
+	def startEntry(self):
+		if self.entryCount:
+			self.f.write('\n')
+		self.entryCount += 1
+
+	def append(self, entry):
+		self.startEntry()
+		self.f.write(entry)
+
+	def extend(self, lines):
+		'Writes the lines as a single entry, like appending them joined.'
+		self.startEntry()
+		for i, line in enumerate(lines):
+			if i:
+				self.f.write('\n')
+			self.f.write(line)
+
+	def close(self):
+		if self.entryCount:
+			self.f.write('\n')
+
+
+
 class MakeSubtables(KernDataClass):
 	def __init__(self, kernDict, checkSide='first', RTL=False):
 		self.kernDict  = kernDict
@@ -99,9 +99,22 @@ v2.1   - Apr 26 2013 - RTL tags were changed to minimize conflicts with anchor n
 v2.2   - May 01 2013 - Fixed bug in processing FontLab classes.
 v2.2.1 - Aug 16 2013 - Changed names of output files.
 v2.2.2 - Oct 12 2015 - Improved nameless anchor check.
+v2.3   - Oct 17 2026 - The glyph names of the font, the marks and the ligatures are collected into sets once, for validation and anchor collection.
+v2.4   - Oct 17 2026 - Anchors are stored as records with integer coordinates, and grouped by mark type in a single pass before building lookups.
+v2.5   - Oct 17 2026 - Added the writeFiles option, to only collect the anchor data for building lookups by other means.
 """
 
-import os, time, re
+import os, time, re, collections
+
+
+AnchorRecord = collections.namedtuple('AnchorRecord', ['name', 'x', 'y']) # keys of anchorsDataInCombMarksDict and anchorsDataInBaseGlyphsDict
+GlyphAnchorRecord = collections.namedtuple('GlyphAnchorRecord', ['glyphName', 'x', 'y']) # mark-to-mark anchors
+ComponentAnchorRecord = collections.namedtuple('ComponentAnchorRecord', ['order', 'x', 'y']) # ligature anchors, e.g. ('1ST', 1735, 358)
+LigatureAnchorRecord = collections.namedtuple('LigatureAnchorRecord', ['name', 'glyphName', 'elementCount', 'components'])
+
+def sortKey(record):
+	'Sorts records as their former comma-joined strings were sorted.'
+	return tuple(str(i) for i in record)
 
 
 class WhichApp(object):
@@ -143,7 +156,7 @@ class WhichApp(object):
 
 class MarkDataClass(object):
 
-	def __init__(self, font, folderPath, trimCasingTags=kDefaultTrimCasingTags, genMkmkFeature=kDefaultGenMkmkFeature, writeClassesFile=kDefaultWriteMarkClassesFile, indianScriptsFormat=kDefaultIndianScriptsFormat):
+	def __init__(self, font, folderPath, trimCasingTags=kDefaultTrimCasingTags, genMkmkFeature=kDefaultGenMkmkFeature, writeClassesFile=kDefaultWriteMarkClassesFile, indianScriptsFormat=kDefaultIndianScriptsFormat, writeFiles=True):
 		self.header = ['# Created: %s' % time.ctime()]
 
 		appTest = WhichApp()
@@ -159,26 +172,32 @@ class MarkDataClass(object):
 		self.genMkmkFeature = genMkmkFeature
 		self.writeClassesFile = writeClassesFile
 		self.indianScriptsFormat = indianScriptsFormat
+		self.writeFiles = writeFiles
 
 		self.lineBreak = '\n'
 		self.marksClassList = []
 		self.ligatureComponentsList = list(range(2,len(kLigatureComponentOrderTags)+1)) # ligatures have a minimum of 2 components and a maximum determined by the size of kLigatureComponentOrderTags
 		self.ligatureClassesDict = {}
 		self.allLigaturesList = []
+		self.glyphNamesSet = set()
+		self.marksAndLigaturesSet = set()
 		self.invalidGlyphNamesList = []
 		self.repeatedGlyphNamesList = []
 		self.markTypesList = []
 		self.anchorNamesNotTrimmed = []
+		self.anchorNamesNotTrimmedSet = set()
 
-		self.anchorsDataInCombMarksDict = {}
-		self.anchorsDataInBaseGlyphsDict = {}
-		self.anchorsDataInLigaturesDict = {}
+		self.anchorsDataInCombMarksDict = {} # {AnchorRecord('_above', 0, 694): ['gravecmb', 'acutecmb']}
+		self.anchorsDataInBaseGlyphsDict = {} # {AnchorRecord('above', 250, 700): ['a', 'o']}
+		self.anchorsDataInLigaturesDict = {} # {('above', 'f_i'): LigatureAnchorRecord('above', 'f_i', 2, [ComponentAnchorRecord('1ST', 150, 700), ...])}
+		self.baseAnchorsByMarkType = {} # {'above': [AnchorRecord('above', 250, 700), ...]}
+		self.ligatureAnchorsByMarkType = {} # {'above': [LigatureAnchorRecord(...), ...]}
 		self.markRelatedGlyphClassLinesList = []
 		self.markRelatedMarkClassLinesList = []
 		self.baseRelatedBasePosLinesList = []
 		self.ligatureRelatedBasePosLinesList = []
 
-		self.anchorsDataInCombMkmksDict = {} # {'below': ['gravebelowcmb,0,-246', 'acutebelowcmb,0,-246'], 'above': ['gravecmb,0,713', 'acutecmb,0,713']}
+		self.anchorsDataInCombMkmksDict = {} # {'below': [GlyphAnchorRecord('gravebelowcmb', 0, -246), ...], 'above': [GlyphAnchorRecord('gravecmb', 0, 713), ...]}
 		self.mkmkRelatedBasePosLinesList = []
 		self.classesNote = ''
 
@@ -196,6 +215,7 @@ class MarkDataClass(object):
 		else:
 			self.header.append('# PS Name: %s' % self.f.info.postscriptFontName)
 			self.header.append('# MM Inst: %s' % self.f.info.styleMapFamilyName)
+			self.glyphNamesSet = set(self.f.keys())
 
 			if kCombMarksClassName in self.f.groups:
 				self.marksClassList = self.f.groups[kCombMarksClassName]
@@ -221,6 +241,8 @@ class MarkDataClass(object):
 
 		if len(self.ligatureClassesDict):
 			self.addAllLigaturesToList()
+		self.marksAndLigaturesSet = set(self.marksClassList)
+		self.marksAndLigaturesSet.update(self.allLigaturesList)
 
 		self.collectAnchorDataFromCombMarks()
 		if not len(self.anchorsDataInCombMarksDict):
@@ -242,6 +264,12 @@ class MarkDataClass(object):
 		if len(self.ligatureClassesDict):
 			self.collectAnchorDataFromLigatureGlyphs()
 
+		if not self.writeFiles:
+			self.groupAnchorsByMarkType()
+			if self.genMkmkFeature:
+				self.collectAnchorDataFromCombMkmk()
+			return
+
 		self.buildMarkLookups()
 
 		if len(self.anchorNamesNotTrimmed):
@@ -270,34 +298,34 @@ class MarkDataClass(object):
 			if self.f.FindGlyph(gName) != -1:
 				return True
 		else:
-			if gName in list(self.f.keys()):
+			if gName in self.glyphNamesSet:
 				return True
 		return False
 
 
 	def validateCombMarksClassContents(self):
-		tempGlist = []
+		tempGlist = set()
 		for gName in self.marksClassList:
 			if not self.glyphFoundInFont(gName):
 				self.invalidGlyphNamesList.append(gName)
 			if gName not in tempGlist:
-				tempGlist.append(gName)
+				tempGlist.add(gName)
 			else:
 				self.repeatedGlyphNamesList.append(gName)
 				print("\tERROR: The glyph named %s is repeated in the class named %s" % (gName, kCombMarksClassName))
 
 
 	def validateLigatureClassesContents(self):
-		tempAllGlist = []
+		tempAllGlist = set()
 		for element in self.ligatureClassesDict:
-			tempGlist = []
+			tempGlist = set()
 			for gName in self.ligatureClassesDict[element]:
 				if not self.glyphFoundInFont(gName):
 					self.invalidGlyphNamesList.append(gName)
 				if gName not in tempGlist:
-					tempGlist.append(gName)
+					tempGlist.add(gName)
 					if gName not in tempAllGlist:
-						tempAllGlist.append(gName)
+						tempAllGlist.add(gName)
 					else:
 						self.repeatedGlyphNamesList.append(gName)
 						print("\tERROR: The glyph named %s is used in more than one ligature class." % (gName))
@@ -324,18 +352,17 @@ class MarkDataClass(object):
 		if len(anchorName) >= kCasingTagSize + 3: # +3 to guarantee that the name is long enough and will remain long enough after being trimmed
 			if anchorName[-kCasingTagSize:] in kCasingTagsList:
 				return anchorName[:-kCasingTagSize]
-		if anchorName not in self.anchorNamesNotTrimmed:
+		if anchorName not in self.anchorNamesNotTrimmedSet:
+			self.anchorNamesNotTrimmedSet.add(anchorName)
 			self.anchorNamesNotTrimmed.append(anchorName)
 		return anchorName
 
 
 	def collectMarkTypesList(self):
-		uniqueMarksList = list(self.anchorsDataInCombMarksDict.keys())
-		for mark in uniqueMarksList:
-			markName = mark.split(',')[0][1:]  # ['_above,0,694', '_centerAR,0,0', '_above,0,519'] Removes the initial underscore as well
-			if markName not in self.markTypesList:
-				self.markTypesList.append(markName)
-		self.markTypesList.sort()
+		markTypes = set()
+		for anchor in self.anchorsDataInCombMarksDict:
+			markTypes.add(anchor.name[1:])  # Removes the initial underscore
+		self.markTypesList = sorted(markTypes)
 
 
 	def collectAnchorDataFromCombMarks(self):
@@ -355,7 +382,7 @@ class MarkDataClass(object):
 						point = g.anchors[anchorIndex]
 						if self.trimCasingTags:
 							anchorName = self.trimCaseTags(anchorName)
-						anchor = "%s,%d,%d" % (anchorName, point.x, point.y)
+						anchor = AnchorRecord(anchorName, int(point.x), int(point.y))
 						self.addAnchorDataToDict(anchor, gName, self.anchorsDataInCombMarksDict)
 
 
@@ -369,7 +396,7 @@ class MarkDataClass(object):
 				glyphs.append(self.f[name])
 		for g in glyphs:
 			gName = g.name
-			if gName not in (self.marksClassList + self.allLigaturesList):
+			if gName not in self.marksAndLigaturesSet:
 				markNamesLog = []
 				for anchorIndex in range(len(g.anchors)):
 					anchorName = g.anchors[anchorIndex].name
@@ -384,7 +411,7 @@ class MarkDataClass(object):
 							point = g.anchors[anchorIndex]
 							if self.trimCasingTags:
 								anchorName = self.trimCaseTags(anchorName)
-							anchor = "%s,%d,%d" % (anchorName, point.x, point.y)
+							anchor = AnchorRecord(anchorName, int(point.x), int(point.y))
 							self.addAnchorDataToDict(anchor, gName, self.anchorsDataInBaseGlyphsDict)
 
 
@@ -415,22 +442,21 @@ class MarkDataClass(object):
 									if strippedAnchorName[-1] == "_":
 										strippedAnchorName = strippedAnchorName[:-1] # remove the last character of the anchor's name, if it happens to be an underscore
 
-									dictKey = "%s,%s" % (strippedAnchorName, gName)
-									anchor = "%s,%d,%d" % (elementOrder, point.x, point.y)
+									dictKey = (strippedAnchorName, gName)
+									anchor = ComponentAnchorRecord(elementOrder, int(point.x), int(point.y))
 
 									if dictKey not in self.anchorsDataInLigaturesDict:
-										self.anchorsDataInLigaturesDict[dictKey] = [elementNum, anchor]
+										self.anchorsDataInLigaturesDict[dictKey] = LigatureAnchorRecord(strippedAnchorName, gName, elementNum, [anchor])
 									else:
-										self.anchorsDataInLigaturesDict[dictKey].append(anchor)
+										self.anchorsDataInLigaturesDict[dictKey].components.append(anchor)
 
 									break  # no need to finish the loop since a match was found
 
 
 	def buildMarkRelatedLines(self):
-		anchorGroupList = list(self.anchorsDataInCombMarksDict.keys())
-		anchorGroupList.sort()
+		anchorGroupList = sorted(self.anchorsDataInCombMarksDict, key=sortKey)
 		for anchor in anchorGroupList:
-			anchorName, anchorX, anchorY = anchor.split(',')
+			anchorName, anchorX, anchorY = sortKey(anchor)
 			markClassName = "@MC%s" % anchorName
 			if kIgnoreAnchorTag in markClassName: # Don't make mark classes from contextual anchors
 				continue
@@ -447,7 +473,19 @@ class MarkDataClass(object):
 				self.markRelatedMarkClassLinesList.append(markClassLine)
 
 
+	def groupAnchorsByMarkType(self):
+		'Buckets the anchors of base glyphs and ligatures by mark type, in one pass over each.'
+		self.baseAnchorsByMarkType = {}
+		for anchor in sorted(self.anchorsDataInBaseGlyphsDict, key=sortKey):
+			self.baseAnchorsByMarkType.setdefault(anchor.name, []).append(anchor)
+		self.ligatureAnchorsByMarkType = {}
+		for key in sorted(self.anchorsDataInLigaturesDict):
+			record = self.anchorsDataInLigaturesDict[key]
+			self.ligatureAnchorsByMarkType.setdefault(record.name, []).append(record)
+
+
 	def buildMarkLookups(self):
+		self.groupAnchorsByMarkType()
 		for markType in self.markTypesList:
 			baseLinesList = self.buildBaseRelatedLines(markType)
 
@@ -476,16 +514,11 @@ class MarkDataClass(object):
 
 
 	def buildBaseRelatedLines(self, markTypeName):
-		anchorGroupList = list(self.anchorsDataInBaseGlyphsDict.keys()) # ['aboveAR,1675,697', 'below,367,-30', ... ]
-		anchorGroupList.sort()
 		glyphClassLinesList = []
 		basePosLinesList = []
 
-		for anchor in anchorGroupList:
-			anchorName, anchorX, anchorY = anchor.split(',')
-
-			if anchorName != markTypeName: # skip anchors that are not the same kind of the one requested
-				continue
+		for anchor in self.baseAnchorsByMarkType.get(markTypeName, []):
+			anchorName, anchorX, anchorY = anchor
 
 			anchorAndMarkClass = "<anchor %s %s> mark @MC_%s" % (anchorX, anchorY, anchorName)
 
@@ -508,19 +541,11 @@ class MarkDataClass(object):
 
 
 	def buildLigatureRelatedLines(self, markTypeName):
-		anchorGroupList = list(self.anchorsDataInLigaturesDict.keys()) # ['aboveAR,arAlefMaksura_AlefMaksura', 'aboveAR,arAlefMaksura_AlefMaksura.f', 'aboveAR,arAlefMaksura_AlefMaksura.fj',
-		anchorGroupList.sort()
 		ligaturePosLinesList = []
 
-		for anchor in anchorGroupList:
-			anchorName, gName = anchor.split(',')
-
-			if anchorName != markTypeName: # skip anchors that are not the same kind of the one requested
-				continue
-
-			elementCount = int(self.anchorsDataInLigaturesDict[anchor][0])
-			anchorPositionsList = self.anchorsDataInLigaturesDict[anchor][1:]  # ['1ST,1735,358', '2ND,680,234']
-			anchorPositionsList.sort()
+		for record in self.ligatureAnchorsByMarkType.get(markTypeName, []):
+			anchorName, gName, elementCount = record.name, record.glyphName, record.elementCount
+			anchorPositionsList = sorted(record.components, key=sortKey)
 
 			if elementCount != len(anchorPositionsList):
 				print("\tNOT IMPLEMENTED WARNING: Number of elements in ligature %s does not match the number of anchors of the type %s." % (gName, anchorName))
@@ -529,8 +554,7 @@ class MarkDataClass(object):
 			elementsAnchorsAndMarkClassesList = []
 
 			for position in anchorPositionsList:
-				ord, anchorX, anchorY = position.split(',')
-				anchorAndMarkClass = "<anchor %s %s> mark @MC_%s" % (anchorX, anchorY, anchorName)
+				anchorAndMarkClass = "<anchor %s %s> mark @MC_%s" % (position.x, position.y, anchorName)
 				elementsAnchorsAndMarkClassesList.append(anchorAndMarkClass)
 
 			ligaturePosLine = "\tpos ligature %s %s;\n" % (gName, ' ligComponent '.join(elementsAnchorsAndMarkClassesList))
@@ -644,7 +668,7 @@ class MarkDataClass(object):
 						point = g.anchors[anchorIndex]
 						if self.trimCasingTags:
 							anchorName = self.trimCaseTags(anchorName)
-						gAnchor = "%s,%d,%d" % (gName, point.x, point.y)
+						gAnchor = GlyphAnchorRecord(gName, int(point.x), int(point.y))
 						self.addAnchorDataToDict(anchorName, gAnchor, self.anchorsDataInCombMkmksDict)
 
 
@@ -660,9 +684,9 @@ class MarkDataClass(object):
 			if (not (kIndianAboveMarks in markClassName or kIndianBelowMarks in markClassName)) or (not self.indianScriptsFormat): # skip the lookupflag for Indian script lookups but only when the output format is for Indian scripts as well
 				self.mkmkRelatedBasePosLinesList.append("\tlookupflag %sMarkAttachmentType %s;\n\n" % (rtlFlag, markClassName))
 			mkmkAnchorsList = self.anchorsDataInCombMkmksDict[anchorName]
-			mkmkAnchorsList.sort()
+			mkmkAnchorsList.sort(key=sortKey)
 			for mkmkAnchor in mkmkAnchorsList:
-				glyphName, anchorX, anchorY = mkmkAnchor.split(',')
+				glyphName, anchorX, anchorY = mkmkAnchor
 				mkmkLine = "\tpos mark %s <anchor %s %s> mark %s;\n" % (glyphName, anchorX, anchorY, markClassName)
 				self.mkmkRelatedBasePosLinesList.append(mkmkLine)
 			self.mkmkRelatedBasePosLinesList.append("} %s;\n\n\n" % lookupName)
@@ -2,7 +2,7 @@
 import sys
 import os
 import re
-import itertools
+from collections.abc import Mapping
 
 
 __doc__ = '''\
@@ -19,22 +19,87 @@ python getKerningPairsFromFeatureFile.py -go <path to GlyphOrderAndAliasDB file>
 
 '''
 
-# Regular expressions for parsing individual kerning commands:
-x_range_range = re.compile(r'\s*(enum\s+?)?pos\s+?\[\s*(.+?)\s*\]\s+?\[\s*(.+?)\s*\]\s+?(-?\d+?)\s*;')
-x_range_glyph = re.compile(r'\s*(enum\s+?)?pos\s+?\[\s*(.+?)\s*\]\s+?(.+?)\s+?(-?\d+?)\s*;')
-x_glyph_range = re.compile(r'\s*(enum\s+?)?pos\s+?(.+?)\s+?\[\s*(.+?)\s*\]\s+?(-?\d+?)\s*;')
-x_item_item = re.compile(r'\s*(enum\s+?)?pos\s+?(.+?)\s+?(.+?)\s+?(-?\d+?)\s*;')
-expressions = [x_range_range, x_range_glyph, x_glyph_range, x_item_item]
-
-
-class KerningPair(object):
-    'Storing a flattened kerning pair'
-
-    def __init__(self, pair, pairList, value):
-
-        self.pair = pair
-        self.value = value
-        self.pairList = pairList
+# Statements end with `;`, and blocks are opened or closed with `{` or `}`:
+x_delimiter = re.compile(r'[;{}]')
+
+# Regular expression for parsing a glyph class definition or a kerning command:
+x_statement = re.compile(r'''
+    \s*(?:
+        (?P<className>@[^\s=]+)\s*=\s*\[(?P<classItems>[^\]]*)\]
+    |
+        (?P<enum>enum\s+)?pos\s+
+        (?:\[(?P<leftRange>[^\]]*)\]\s*|(?P<leftItem>[^\s\[\]]+)\s+)
+        (?:\[(?P<rightRange>[^\]]*)\]\s*|(?P<rightItem>[^\s\[\]]+)\s+)
+        (?P<value>-?\d+)
+    )\s*$
+    ''', re.VERBOSE)
+
+
+class FlatKerningView(Mapping):
+    'Flattened kerning pairs, resolved on demand; the first command for a pair wins'
+
+    def __init__(self, foundKerningPairs, kernClasses, glyphNameDict=None):
+
+        self.kernClasses = kernClasses
+        self.glyphNameDict = glyphNameDict or {}
+
+        # Each rule is (leftGlyphs, rightGlyphs, set of rightGlyphs, value),
+        # sharing the glyph lists of repeated items:
+        self.rules = []
+        self.ruleIndicesByLeft = {}
+        expanded = {}
+        for enum, (left, right), value in foundKerningPairs:
+            for item in left, right:
+                if item not in expanded:
+                    glyphs = self.expand(item)
+                    expanded[item] = glyphs, set(glyphs)
+            leftGlyphs = expanded[left][0]
+            rightGlyphs, rightGlyphsSet = expanded[right]
+            for glyph in leftGlyphs:
+                self.ruleIndicesByLeft.setdefault(glyph, []).append(len(self.rules))
+            self.rules.append((leftGlyphs, rightGlyphs, rightGlyphsSet, value))
+
+    def expand(self, item):
+        # Glyphs of something like x, @MMK_x, or an ad-hoc group
+        # like [ a b c ] or [ a @MMK_x c ], without duplicates:
+        glyphs = []
+        for part in item.split():
+            glyphs.extend(self.kernClasses.get(part, [part]))
+        return list(dict.fromkeys(self.glyphNameDict.get(i, i) for i in glyphs))
+
+    def getRuleIndex(self, left, right):
+        for ruleIndex in self.ruleIndicesByLeft.get(left, []):
+            if right in self.rules[ruleIndex][2]:
+                return ruleIndex
+        return None
+
+    def __getitem__(self, pair):
+        ruleIndex = self.getRuleIndex(*pair)
+        if ruleIndex is None:
+            raise KeyError(pair)
+        return self.rules[ruleIndex][3]
+
+    def __contains__(self, pair):
+        return self.getRuleIndex(*pair) is not None
+
+    def iterItems(self):
+        # Yields each effective pair once, with its value, left glyph by
+        # left glyph, skipping pairs already covered by earlier rules:
+        for left, ruleIndices in self.ruleIndicesByLeft.items():
+            covered = set()
+            for ruleIndex in ruleIndices:
+                leftGlyphs, rightGlyphs, rightGlyphsSet, value = self.rules[ruleIndex]
+                for right in rightGlyphs:
+                    if right not in covered:
+                        yield (left, right), value
+                covered.update(rightGlyphsSet)
+
+    def __iter__(self):
+        for pair, value in self.iterItems():
+            yield pair
+
+    def __len__(self):
+        return sum(1 for _ in self.iterItems())
 
 
 class FEAKernReader(object):
@@ -49,21 +114,20 @@ class FEAKernReader(object):
 
         self.featureFilePath = self.options[-1]
 
-        self.featureData = self.readFile(self.featureFilePath)
-        self.kernClasses = self.readKernClasses()
-
+        self.kernClasses = {}
         self.foundKerningPairs = self.parseKernLines()
-        self.flatKerningPairs = self.makeFlatPairs()
 
+        self.glyphNameDict = {}
         if self.goadbPath:
-            self.glyphNameDict = {}
             self.readGOADB()
-            self.flatKerningPairs = self.convertNames(self.flatKerningPairs)
+        self.flatKerningPairs = self.makeFlatPairs()
 
-        self.output = []
-        for (left, right), value in list(self.flatKerningPairs.items()):
-            self.output.append('/%s /%s %s' % (left, right, value))
-        self.output.sort()
+    @property
+    def output(self):
+        return sorted(
+            '/%s /%s %s' % (left, right, value)
+            for (left, right), value in self.flatKerningPairs.iterItems()
+        )
 
     def readFile(self, filePath):
         # reads raw file, removes commented lines
@@ -80,113 +144,47 @@ class FEAKernReader(object):
         lineString = '\n'.join(lineList)
         return lineString
 
-    def convertNames(self, pairDict):
-        newPairDict = {}
-        for (left, right), value in list(pairDict.items()):
-            newLeft = self.glyphNameDict.get(left)
-            newRight = self.glyphNameDict.get(right)
-
-            # in case the glyphs are not in the GOADB:
-            if not newLeft:
-                newLeft = left
-            if not newRight:
-                newRight = right
-
-            newPair = (newLeft, newRight)
-            newPairDict[newPair] = value
-
-        return newPairDict
-
-    def readKernClasses(self):
-        allClassesList = re.findall(r"(@\S+)\s*=\s*\[([ A-Za-z0-9_.]+)\]\s*;", self.featureData)
-
-        classes = {}
-        for name, glyphs in allClassesList:
-            classes[name] = glyphs.split()
-
-        return classes
-
-    def allCombinations(self, left, right):
-        if len(left.split()) > 1:
-            # The left kerning object is an ad-hoc group
-            # like [ a b c ] or [ a @MMK_x c ]:
-            leftGlyphs = []
-            leftItems = left.split()
-            for item in leftItems:
-                classFound = self.kernClasses.get(item, None)
-                if classFound:
-                    leftGlyphs.extend(classFound)
-                else:
-                    leftGlyphs.append(item)
-
-        else:
-            # The left kerning object is something like x or @MMK_x:
-            leftGlyphs = self.kernClasses.get(left, [left])
-
-        if len(right.split()) > 1:
-            # The right kerning object is an ad-hoc group
-            # like [ a b c ] or [ a @MMK_x c ]:
-            rightGlyphs = []
-            rightItems = right.split()
-            for item in rightItems:
-                classFound = self.kernClasses.get(item, None)
-                if classFound:
-                    rightGlyphs.extend(classFound)
-                else:
-                    rightGlyphs.append(item)
-        else:
-            # The right kerning object is something like x or @MMK_x:
-            rightGlyphs = self.kernClasses.get(right, [right])
-
-        combinations = list(itertools.product(leftGlyphs, rightGlyphs))
-        return combinations
+    def readStatements(self, filePath):
+        # streams the file one statement at a time, without comments,
+        # so that statements may span several lines
+        pending = ''
+        with open(filePath, 'r') as inputfile:
+            for line in inputfile:
+                if '#' in line:
+                    line = line.split('#')[0]
+                statements = x_delimiter.split(pending + line)
+                pending = statements.pop()
+                for statement in statements:
+                    yield statement
+        if pending.strip():
+            yield pending
 
     def parseKernLines(self):
-        featureLines = self.featureData.splitlines()
+        # collects glyph classes into self.kernClasses on the way,
+        # with references to earlier classes expanded
         foundKerningPairs = []
-        for line in featureLines:
-            for expression in expressions:
-                match = re.match(expression, line)
-                if match:
-                    enum = match.group(1)
-                    pair = (match.group(2), match.group(3))
-                    value = match.group(4)
-                    foundKerningPairs.append([enum, pair, value])
-                    break
-                else:
-                    continue
+        for statement in self.readStatements(self.featureFilePath):
+            if '@' not in statement and 'pos' not in statement:
+                continue
+            match = x_statement.match(statement)
+            if not match:
+                continue
+            className = match.group('className')
+            if className:
+                glyphs = []
+                for item in match.group('classItems').split():
+                    glyphs.extend(self.kernClasses.get(item, [item]))
+                self.kernClasses[className] = glyphs
+            else:
+                left = match.group('leftItem') or ' '.join(match.group('leftRange').split())
+                right = match.group('rightItem') or ' '.join(match.group('rightRange').split())
+                foundKerningPairs.append([match.group('enum'), (left, right), match.group('value')])
         return foundKerningPairs
 
     def makeFlatPairs(self):
-        indexedPairs = {}
-        flatKerningPairs = {}
-
-        for pIndex, (enum, pair, value) in enumerate(self.foundKerningPairs):
-            left = pair[0]
-            right = pair[1]
-
-            if enum:
-                # `enum` is shorthand for breaking down a one-line
-                # command into multiple single pairs
-                pairList = self.allCombinations(left, right)
-
-            elif '@'not in left and '@' not in right:
-                # glyph-to-glyph kerning
-                pairList = [pair]
-
-            else:
-                # class-to-class, class-to-glyph, or glyph-to-class kerning
-                pairList = self.allCombinations(left, right)
-
-            indexedPairs[pIndex] = KerningPair(pair, pairList, value)
-
-        # Iterate through the kerning pairs in reverse order to
-        # overwrite less specific pairs with more specific ones:
-        for pIndex, kerningPair in sorted(list(indexedPairs.items()), reverse=True):
-            for pair in kerningPair.pairList:
-                flatKerningPairs[pair] = kerningPair.value
-
-        return flatKerningPairs
+        # The flattened pairs are not materialized, so that large class
+        # kerning is never exploded into single pairs in memory:
+        return FlatKerningView(self.foundKerningPairs, self.kernClasses, self.glyphNameDict)
 
     def readGOADB(self):
         goadbList = self.readFile(self.goadbPath).splitlines()
@@ -1,4 +1,4 @@
-import os, sys, functools, shutil, errno
+import os, sys, functools, shutil, errno, collections, hashlib, importlib, pickle, threading
 
 def relative_to_interpreter(path):
     return os.path.join(os.path.dirname(sys.executable), path)
@@ -9,17 +9,108 @@ def relative_to_package(path):
 def relative_to_cwd(path):
     return os.path.join(os.getcwd(), path)
 
-def memoize(obj):
+def get_persistent_cache_directory():
+    return os.environ.get(
+        "HINDKIT_CACHE",
+        os.path.join(os.path.expanduser("~"), ".cache", "hindkit"),
+    )
+
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+def memoize(obj=None, maxsize=None, typed=False, persist=False, depends_on=()):
     """
-    Decorator to add caching in function.
+    Decorator to add caching in function, either bare (`@memoize`) or with options (`@memoize(maxsize=128)`).
+    :param maxsize: Number of results to keep, least recently used ones are evicted first. None for no limit.
+    :param typed: Cache arguments of different types separately, e.g. 1 and 1.0.
+    :param persist: Also keep results in a pickle file in the persistent cache directory ($HINDKIT_CACHE, or ~/.cache/hindkit), for later runs.
+    :param depends_on: Paths a persisted result is derived from, or a function of the arguments returning them. The result is recomputed when they or the function's module change.
     """
-    memoized = {}
+    if obj is None:
+        return functools.partial(
+            memoize,
+            maxsize = maxsize,
+            typed = typed,
+            persist = persist,
+            depends_on = depends_on,
+        )
+
+    memoized = collections.OrderedDict()
+    lock = threading.RLock()
+    statistics = {"hits": 0, "misses": 0}
+
+    def get_key(args, kwargs):
+        key = args
+        if kwargs:
+            key += (memoize,) + tuple(sorted(kwargs.items()))
+        if typed:
+            key += tuple(type(i) for i in args) + tuple(type(i) for i in kwargs.values())
+        return key
+
+    def get_persistent_path(key, args, kwargs):
+        paths = depends_on(*args, **kwargs) if callable(depends_on) else depends_on
+        stamp = [
+            (path, os.stat(path).st_mtime_ns, os.stat(path).st_size)
+            for path in [obj.__code__.co_filename] + list(paths)
+        ]
+        digest = hashlib.sha256(repr((key, stamp)).encode()).hexdigest()
+        return os.path.join(
+            get_persistent_cache_directory(),
+            "{}.{}-{}.pickle".format(obj.__module__, obj.__qualname__, digest[:16]),
+        )
+
+    def compute(key, args, kwargs):
+        if not persist:
+            return obj(*args, **kwargs)
+        path = get_persistent_path(key, args, kwargs)
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            pass
+        result = obj(*args, **kwargs)
+        try:
+            makedirs(os.path.dirname(path))
+            temp_path = "{}.{}.tmp".format(path, os.getpid())
+            with open(temp_path, "wb") as f:
+                pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except OSError:
+            pass
+        return result
+
     @functools.wraps(obj)
     def memoizer(*args, **kwargs):
-        k = str(args) + str(kwargs)
-        if k not in memoized:
-            memoized[k] = obj(*args, **kwargs)
-        return memoized[k]
+        try:
+            key = get_key(args, kwargs)
+            hash(key)
+        except TypeError:
+            # Unhashable arguments are not cached.
+            return obj(*args, **kwargs)
+        with lock:
+            if key in memoized:
+                statistics["hits"] += 1
+                memoized.move_to_end(key)
+                return memoized[key]
+            statistics["misses"] += 1
+        result = compute(key, args, kwargs)
+        with lock:
+            memoized[key] = result
+            if maxsize is not None:
+                while len(memoized) > maxsize:
+                    memoized.popitem(last=False)
+        return result
+
+    def cache_info():
+        with lock:
+            return CacheInfo(statistics["hits"], statistics["misses"], maxsize, len(memoized))
+
+    def cache_clear():
+        with lock:
+            memoized.clear()
+            statistics.update(hits=0, misses=0)
+
+    memoizer.cache_info = cache_info
+    memoizer.cache_clear = cache_clear
     return memoizer
 
 def remove(path):
@@ -72,17 +163,41 @@ def remove_illegal_chars_for_postscript_name_part(name):
     })
 
 """
-To have a import functionality of library at single entry point
+To have a import functionality of library at single entry point.
+Objects are imported on first use, as their modules pull in defcon, fontTools, ufo2ft, mutatorMath and the AFDKO.
 """
 from hindkit import constants
 from hindkit import filters
 
-from hindkit.objects.base import BaseFile
-from hindkit.objects.family import Family, DesignSpace, Fmndb
-from hindkit.objects.font import Master, Style, Product
-from hindkit.objects.glyphdata import GlyphData, Goadb
-from hindkit.objects.client import Client
-from hindkit.objects.feature import (FeatureClasses, FeatureTables, FeatureLanguagesystems, FeatureGSUB, FeatureGPOS,
-                                     FeatureKern, FeatureMark, FeatureOS2Extension, FeatureNameExtension,
-                                     FeatureMatches, FeatureReferences)
-from hindkit.objects.project import Project
+_NAME_TO_MODULE_NAME = {}
+for module_name, names in [
+    ("base", ["BaseFile"]),
+    ("cache", ["BuildCache"]),
+    ("family", ["Family", "DesignSpace", "Fmndb"]),
+    ("font", ["Master", "Style", "Product"]),
+    ("glyphdata", ["GlyphData", "Goadb"]),
+    ("interpolation", ["Interpolator"]),
+    ("gpos", ["KernLookupBuilder", "MarkLookupBuilder"]),
+    ("client", ["Client"]),
+    ("feature", [
+        "FeatureClasses", "FeatureTables", "FeatureLanguagesystems", "FeatureGSUB", "FeatureGPOS",
+        "FeatureKern", "FeatureMark", "FeatureOS2Extension", "FeatureNameExtension",
+        "FeatureMatches", "FeatureReferences",
+    ]),
+    ("instrumentation", ["Instrumentation"]),
+    ("scheduler", ["Task", "Scheduler"]),
+    ("project", ["Project"]),
+]:
+    for name in names:
+        _NAME_TO_MODULE_NAME[name] = "hindkit.objects." + module_name
+
+def __getattr__(name):
+    module_name = _NAME_TO_MODULE_NAME.get(name)
+    if module_name is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_NAME_TO_MODULE_NAME))
@@ -1,6 +1,5 @@
-import os, collections
-
 import hindkit as kit
+from hindkit import dataindex
 
 DERIVABLE_GLYPHS = {
     None: ["NULL", ".null", "zerowidthspace", "uni200B"],
@@ -208,43 +207,21 @@ for script in SCRIPTS:
 
 @kit.memoize
 def get_u_scalar_to_u_name():
-    u_scalar_to_u_name = {}
-    with open(kit.relative_to_package("data/UnicodeData.txt")) as f:
-        for line in f:
-            u_scalar, u_name, rest = line.split(";", 2)
-            if not u_name.startswith("<"):
-                u_scalar_to_u_name[u_scalar] = u_name
-    return u_scalar_to_u_name
+    return dataindex.IndexMapping(dataindex.load("UnicodeData.txt"))
 
 @kit.memoize
 def get_glyph_list(filename, with_u_scalar=False):
-    glyph_list = collections.OrderedDict()
-    with open(kit.relative_to_package("data/" + filename)) as f:
-        for line in f:
-            line_without_comment = line.partition("#")[0].strip()
-            if line_without_comment:
-                u_scalar, glyph_name, u_name = line_without_comment.split(";")
-                if with_u_scalar:
-                    glyph_list[glyph_name] = (u_scalar, u_name)
-                else:
-                    glyph_list[glyph_name] = u_name
-    return glyph_list
+    return dataindex.IndexMapping(
+        dataindex.load(filename),
+        fields = (1, 2) if with_u_scalar else 2,
+    )
 
 @kit.memoize
 def get_adobe_latin(number, get_combined=False):
-    adobe_latin = collections.OrderedDict()
     suffix = str(number)
     if number > 3:
         suffix = suffix + ("-combined" if get_combined else "-precomposed")
-    with open(
-        kit.relative_to_package("data/adobe-latin-{}.txt".format(suffix))
-    ) as f:
-        next(f)
-        for line in f:
-            parts = line.strip().split("\t")[:4]
-            u_scalar, u_character, production_name, u_name = parts
-            adobe_latin[production_name] = u_scalar
-    return adobe_latin
+    return dataindex.IndexMapping(dataindex.load("adobe-latin-{}.txt".format(suffix)))
 
 ITF_GENERAL = """exclam quotedbl numbersign dollar percent ampersand quotesingle parenleft parenright asterisk plus 
 comma hyphen period slash zero one two three four five six seven eight nine colon semicolon less equal greater 
@@ -0,0 +1,291 @@
+"""
+Compiled, memory-mapped indexes of the bundled data tables.
+
+Each table is compiled from its text file into an index holding the rows as string IDs, the row numbers sorted by key (the first field), and a pool of unique UTF-8 strings. Lookups bisect the sorted rows and decode only the strings they return, so nothing is parsed at run time.
+
+Indexes are compiled when missing or older than their text file, into `data/index` if the package is writable and into the persistent cache directory otherwise. They are compiled into the package by `setup.py build_py`, or in place with:
+
+    python -m hindkit.dataindex
+"""
+
+import array
+import collections
+import hashlib
+import collections.abc
+import mmap
+import os
+import struct
+import sys
+import threading
+
+import hindkit as kit
+
+MAGIC = b"HKIX"
+VERSION = 2
+HEADER = struct.Struct("<4sHHII16s")  # magic, version, field count, row count, string count, MD5 of the text file
+
+
+def parse_unicode_data(path):
+    """(u_scalar, u_name), skipping ranges and control characters, whose names are in <>."""
+    rows = []
+    with open(path) as f:
+        for line in f:
+            u_scalar, u_name, rest = line.split(";", 2)
+            if not u_name.startswith("<"):
+                rows.append((u_scalar, u_name))
+    return rows
+
+def parse_glyph_list(path):
+    """(glyph_name, u_scalar, u_name)"""
+    glyph_list = collections.OrderedDict()
+    with open(path) as f:
+        for line in f:
+            line_without_comment = line.partition("#")[0].strip()
+            if line_without_comment:
+                u_scalar, glyph_name, u_name = line_without_comment.split(";")
+                glyph_list[glyph_name] = (u_scalar, u_name)
+    return [(k,) + v for k, v in glyph_list.items()]
+
+def parse_adobe_latin(path):
+    """(production_name, u_scalar)"""
+    adobe_latin = collections.OrderedDict()
+    with open(path) as f:
+        next(f)
+        for line in f:
+            parts = line.strip().split("\t")[:4]
+            u_scalar, u_character, production_name, u_name = parts
+            adobe_latin[production_name] = u_scalar
+    return list(adobe_latin.items())
+
+def get_parser(filename):
+    if filename == "UnicodeData.txt":
+        return parse_unicode_data
+    elif filename.startswith("adobe-latin-"):
+        return parse_adobe_latin
+    else:
+        return parse_glyph_list
+
+
+def get_source_digest(source_path):
+    with open(source_path, "rb") as f:
+        return hashlib.md5(f.read()).digest()
+
+def compile_index(rows, path, source_digest=bytes(16)):
+    """Write `rows` (tuples of strings, keyed on their first field) as an index at `path`."""
+
+    field_count = len(rows[0]) if rows else 0
+    string_to_id = {}
+    strings = []
+    row_ids = array.array("I")
+    for row in rows:
+        for string in row:
+            string_id = string_to_id.get(string)
+            if string_id is None:
+                string_id = string_to_id[string] = len(strings)
+                strings.append(string.encode("utf-8"))
+            row_ids.append(string_id)
+
+    sorted_rows = array.array("I", sorted(range(len(rows)), key=lambda i: strings[row_ids[i * field_count]]))
+
+    offsets = array.array("I", [0])
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+
+    if sys.byteorder != "little":
+        for i in [row_ids, sorted_rows, offsets]:
+            i.byteswap()
+
+    kit.makedirs(os.path.dirname(path))
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, field_count, len(rows), len(strings), source_digest))
+        f.write(row_ids.tobytes())
+        f.write(sorted_rows.tobytes())
+        f.write(offsets.tobytes())
+        f.write(b"".join(strings))
+    os.replace(temp_path, path)
+
+
+class Index(object):
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.field_count, self.row_count, string_count, source_digest = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("[INVALID INDEX] " + path)
+        view = memoryview(self._mmap)
+        start = HEADER.size
+        arrays = []
+        for length in [self.row_count * self.field_count, self.row_count, string_count + 1]:
+            end = start + length * 4
+            if sys.byteorder == "little":
+                arrays.append(view[start:end].cast("I"))
+            else:
+                swapped = array.array("I", view[start:end].tobytes())
+                swapped.byteswap()
+                arrays.append(swapped)
+            start = end
+        self._row_ids, self._sorted_rows, self._offsets = arrays
+        self._pool_start = start
+
+    def __len__(self):
+        return self.row_count
+
+    def _get_bytes(self, string_id):
+        return self._mmap[
+            self._pool_start + self._offsets[string_id]:
+            self._pool_start + self._offsets[string_id + 1]
+        ]
+
+    def get_string(self, string_id):
+        return self._get_bytes(string_id).decode("utf-8")
+
+    def get_field(self, row, field):
+        return self.get_string(self._row_ids[row * self.field_count + field])
+
+    def get_row(self, row):
+        return tuple(self.get_field(row, i) for i in range(self.field_count))
+
+    def find(self, key):
+        """:return: Number of the row keyed on `key`, or None."""
+        key = key.encode("utf-8")
+        low, high = 0, self.row_count
+        while low < high:
+            middle = (low + high) // 2
+            row = self._sorted_rows[middle]
+            if self._get_bytes(self._row_ids[row * self.field_count]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.row_count:
+            row = self._sorted_rows[low]
+            if self._get_bytes(self._row_ids[row * self.field_count]) == key:
+                return row
+        return None
+
+
+class IndexMapping(collections.abc.Mapping):
+    """
+    Read-only mapping of the first field of each row to the others, in the order of the text file.
+    :param fields: Numbers of the fields in the values. A single field number for plain values.
+    """
+
+    def __init__(self, index, fields=1):
+        self.index = index
+        self.fields = fields
+
+    def _get_value(self, row):
+        if isinstance(self.fields, int):
+            return self.index.get_field(row, self.fields)
+        return tuple(self.index.get_field(row, i) for i in self.fields)
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            raise KeyError(key)
+        row = self.index.find(key)
+        if row is None:
+            raise KeyError(key)
+        return self._get_value(row)
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self.index.find(key) is not None
+
+    def __iter__(self):
+        for row in range(len(self.index)):
+            yield self.index.get_field(row, 0)
+
+    def __len__(self):
+        return len(self.index)
+
+    def items(self):
+        return IndexItemsView(self)
+
+
+class IndexItemsView(collections.abc.ItemsView):
+
+    def __iter__(self):
+        mapping = self._mapping
+        for row in range(len(mapping.index)):
+            yield mapping.index.get_field(row, 0), mapping._get_value(row)
+
+
+def get_index_path(filename, directory=None):
+    directory = kit.fallback(directory, kit.relative_to_package("data/index"))
+    return os.path.join(directory, filename + ".idx")
+
+def is_up_to_date(index_path, source_path):
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return False
+    magic, version, field_count, row_count, string_count, source_digest = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        return False
+    if os.path.getmtime(index_path) >= os.path.getmtime(source_path):
+        return True
+    # Installers don't keep the order of modification times, so an index compiled at build time is checked by content:
+    if source_digest != get_source_digest(source_path):
+        return False
+    try:
+        os.utime(index_path)
+    except OSError:
+        pass
+    return True
+
+_indexes = {}
+_lock = threading.Lock()
+
+def load(filename):
+    """:return: Index of `data/<filename>`, compiling it first if needed."""
+    with _lock:
+        index = _indexes.get(filename)
+        if index is None:
+            source_path = kit.relative_to_package("data/" + filename)
+            index_path = get_index_path(filename)
+            if not is_up_to_date(index_path, source_path):
+                fallback_path = get_index_path(
+                    filename,
+                    os.path.join(kit.get_persistent_cache_directory(), "index"),
+                )
+                if is_up_to_date(fallback_path, source_path):
+                    index_path = fallback_path
+                else:
+                    rows = get_parser(filename)(source_path)
+                    source_digest = get_source_digest(source_path)
+                    try:
+                        compile_index(rows, index_path, source_digest)
+                    except OSError:
+                        index_path = fallback_path
+                        compile_index(rows, index_path, source_digest)
+            index = _indexes[filename] = Index(index_path)
+        return index
+
+FILENAMES = [
+    "UnicodeData.txt",
+    "aglfn.txt",
+    "itfgl.txt",
+    "adobe-latin-1.txt",
+    "adobe-latin-2.txt",
+    "adobe-latin-3.txt",
+    "adobe-latin-4-combined.txt",
+    "adobe-latin-4-precomposed.txt",
+    "adobe-latin-5-combined.txt",
+    "adobe-latin-5-precomposed.txt",
+]
+
+def compile_all(directory=None):
+    """
+    :param directory: Where to write the indexes, `data/index` by default.
+    """
+    for filename in FILENAMES:
+        source_path = kit.relative_to_package("data/" + filename)
+        index_path = get_index_path(filename, directory)
+        compile_index(get_parser(filename)(source_path), index_path, get_source_digest(source_path))
+        print("[COMPILED]", index_path)
+
+
+if __name__ == "__main__":
+    compile_all()
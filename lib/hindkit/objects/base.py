@@ -120,10 +120,38 @@ class BaseFile(object):
             else:
                 try:
                     kit.makedirs(f.get_directory())
+                    key = f.get_cache_key()
+                    if key and f.project.cache.restore(key, f.get_cache_outputs()):
+                        print("[RESTORED FROM CACHE]", f.get_path())
+                        continue
                     f.generate()
+                    if key:
+                        f.project.cache.store(key, f.get_cache_outputs())
                     print("[GENERATED]", f.get_path())
                 except NotImplementedError:
                     pass
 
     def generate(self):
         raise NotImplementedError("[CAN'T GENERATE] " + self.get_path())
+
+    def get_cache_inputs(self):
+        """
+        :return: (paths, values) that the output of `generate` is derived from, or None if the output can't be cached.
+        """
+        return None
+
+    def get_cache_outputs(self):
+        return [self.get_path()]
+
+    def get_cache_key(self):
+        if self.project is None or self.project.cache is None:
+            return None
+        inputs = self.get_cache_inputs()
+        if inputs is None:
+            return None
+        paths, values = inputs
+        return self.project.cache.get_key(
+            type(self).__name__ + " " + self.get_path(),
+            paths = paths,
+            values = values,
+        )
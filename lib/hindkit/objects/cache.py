@@ -0,0 +1,173 @@
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+import hindkit as kit
+
+
+def get_distribution_version(name):
+    try:
+        from importlib import metadata
+    except ImportError:  # Python < 3.8
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution(name).version
+        except pkg_resources.DistributionNotFound:
+            return None
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+class BuildCache(object):
+    """
+    Content-addressed store of build outputs. An entry is keyed on the hashes of everything its outputs were derived from, so unchanged inputs can be restored instead of being rebuilt.
+    """
+
+    TOOLS = ["afdko", "defcon", "fonttools", "mutatorMath", "ufo2ft"]
+
+    # Options that only decide what to run, not what the outputs are:
+    OPTIONS_IGNORED = [
+        "prepare_masters", "prepare_styles", "prepare_features", "compile",
+        "max_workers", "incremental", "use_build_cache", "save_incrementally",
+        "keep_fonts_in_memory",
+    ]
+
+    def __init__(self, project):
+        self.project = project
+        self.directory = kit.Project.directories["cache"]
+        # Counts of restored and rebuilt entries, shared with forked worker processes:
+        self._counts = multiprocessing.Array("q", 2)
+        self._digest_base = None
+
+    @property
+    def hits(self):
+        return self._counts[0]
+
+    @property
+    def misses(self):
+        return self._counts[1]
+
+    def _count(self, hit):
+        with self._counts.get_lock():
+            self._counts[0 if hit else 1] += 1
+
+    @classmethod
+    def get_tool_versions(cls):
+        return {i: get_distribution_version(i) for i in cls.TOOLS}
+
+    @staticmethod
+    def hash_path(path, digest):
+        """Update `digest` with the content of a file, or of every file in a directory."""
+        if os.path.isdir(path):
+            for root, directory_names, filenames in os.walk(path):
+                directory_names.sort()
+                for filename in sorted(filenames):
+                    file_path = os.path.join(root, filename)
+                    digest.update(os.path.relpath(file_path, path).encode())
+                    BuildCache.hash_path(file_path, digest)
+        elif os.path.isfile(path):
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        else:
+            digest.update(b"\0")
+
+    @property
+    def digest_base(self):
+        """Hash of the tool versions, the options, the build script and HindKit's own code."""
+        if self._digest_base is None:
+            digest = hashlib.sha256()
+            tool_versions = self.get_tool_versions()
+            options = {
+                k: v for k, v in self.project.options.items()
+                if k not in self.OPTIONS_IGNORED
+            }
+            options["--test"] = self.project.args.test
+            digest.update(json.dumps(
+                [tool_versions, options, self.project.fontrevision, self.project.version_string],
+                sort_keys = True,
+                default = repr,
+            ).encode())
+            code_paths = sorted(glob.glob(kit.relative_to_package("**/*.py"), recursive=True))
+            for module_name in ["WriteFeaturesKernFDK", "WriteFeaturesMarkFDK", "getKerningPairsFromFEA"]:
+                module = sys.modules.get(module_name)
+                if module:
+                    code_paths.append(module.__file__)
+            build_script_path = os.path.abspath(sys.argv[0])
+            if os.path.isfile(build_script_path):
+                code_paths.append(build_script_path)
+            for path in code_paths:
+                self.hash_path(path, digest)
+            self._digest_base = digest.digest()
+        return self._digest_base
+
+    def get_key(self, name, paths=(), values=()):
+        """
+        :param name: What is being built, e.g. a class name.
+        :param paths: Files or directories whose content the outputs depend on.
+        :param values: Other inputs, hashed by their `repr`.
+        :return: Hex digest identifying the outputs.
+        """
+        digest = hashlib.sha256(self.digest_base)
+        digest.update(name.encode())
+        for path in paths:
+            digest.update(b"\0")
+            self.hash_path(path, digest)
+        digest.update(repr(list(values)).encode())
+        return digest.hexdigest()
+
+    def _get_entry_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def restore(self, key, paths):
+        """
+        Copy the outputs stored under `key` to `paths`, in the order they were stored in.
+        :return: True if the entry exists.
+        """
+        entry_path = self._get_entry_path(key)
+        manifest_path = os.path.join(entry_path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            self._count(hit=False)
+            return False
+        with open(manifest_path) as f:
+            stored = json.load(f)
+        if len(stored) != len(paths):
+            self._count(hit=False)
+            return False
+        for stored_name, path in zip(stored, paths):
+            kit.remove(path)
+            if stored_name is not None:
+                kit.makedirs(os.path.dirname(path) or ".")
+                kit.copy(os.path.join(entry_path, stored_name), path)
+        self._count(hit=True)
+        return True
+
+    def store(self, key, paths):
+        """Copy `paths` into the entry for `key`. Missing paths are recorded as missing outputs."""
+        entry_path = self._get_entry_path(key)
+        if os.path.exists(entry_path):
+            return
+        kit.makedirs(os.path.dirname(entry_path))
+        temp_path = tempfile.mkdtemp(dir=os.path.dirname(entry_path))
+        stored = []
+        for i, path in enumerate(paths):
+            if os.path.exists(path):
+                stored_name = "{}-{}".format(i, os.path.basename(path))
+                kit.copy(path, os.path.join(temp_path, stored_name))
+                stored.append(stored_name)
+            else:
+                stored.append(None)
+        with open(os.path.join(temp_path, "manifest.json"), "w") as f:
+            json.dump(stored, f)
+        try:
+            os.rename(temp_path, entry_path)
+        except OSError:
+            # Another process stored the same entry first.
+            shutil.rmtree(temp_path)
@@ -1,8 +1,11 @@
+import concurrent.futures
+import multiprocessing
 import os
-import shutil
-import subprocess
+import threading
 
 import defcon
+import mutatorMath.objects.location
+import mutatorMath.objects.mutator
 import mutatorMath.ufo.document
 
 import hindkit as kit
@@ -44,6 +47,9 @@ class Family(object):
 
         self.project: kit.Project = None
 
+        self._interpolator = None
+        self._lock = threading.Lock()
+
     def get_client_data(self):
         return kit.Client(self, self.client_name)
 
@@ -77,45 +83,126 @@ class Family(object):
     def _has_mI_variants(self):
         raise NotImplementedError()
 
+    def get_master_weights(self, location):
+        """
+        :return: Weight of each master in an instance at `location`, as mutatorMath interpolates it.
+        """
+        weights = []
+        for i, _ in enumerate(self.masters):
+            _, mutator = mutatorMath.objects.mutator.buildMutator([
+                (DesignSpace.get_location(master.location), 1.0 if j == i else 0.0)
+                for j, master in enumerate(self.masters)
+            ])
+            weights.append(mutator.makeInstance(DesignSpace.get_location(location)))
+        return weights
+
+    def get_style_inputs(self, style):
+        """
+        :return: Paths `style` is prepared from: the masters it is interpolated from, or its source.
+        """
+        if self.masters:
+            weights = self.get_master_weights(style.location)
+            # The first master is where lib, groups and info are copied from.
+            return [
+                master.write() for i, master in enumerate(self.masters)
+                if i == 0 or weights[i]
+            ]
+        else:
+            return [style.get_path(temp=False)]
+
+    def get_style_cache_key(self, style):
+        return self.project.cache.get_key(
+            "style " + style.name,
+            paths = self.get_style_inputs(style),
+            values = [
+                style.name, style.location, style.weight_class, style.width_class,
+                style.full_name_postscript, [i.location for i in self.masters],
+            ],
+        )
+
+    def get_instance_styles(self):
+        """:return: Styles in the order of the instances in the designspace."""
+        return [i.style for i in self.project.products if not i.subsidiary]
+
+    def prepare_designspace(self):
+        for master in self.masters:
+            master.write()
+        self.project.designspace.prepare()
+
     def prepare_styles(self):
+        if self.project.options["run_makeinstances"]:
+            self.prepare_designspace()
+        for style in self.get_instance_styles():
+            self.prepare_style(style)
+
+    def prepare_style(self, style):
+        """
+        Prepare `style`, or restore it from the build cache if its masters (or source) didn't change. With `run_makeinstances`, the designspace must be prepared first.
+        """
 
         p = self.project
-        styles = [i.style for i in p.products if not i.subsidiary]
+
+        key = None
+        if p.cache:
+            key = self.get_style_cache_key(style)
+            if p.cache.restore(key, [style.get_path()]):
+                print("[RESTORED FROM CACHE]", style.get_path())
+                return
 
         if p.options["run_makeinstances"]:
-            self.generate_styles()
+            self.generate_styles([style])
         elif self.masters:
-            for style in styles:
-                kit.copy(style.master.get_path(), style.get_path())
-                if style.file_format == "UFO":
-                    style.open().info.postscriptFontName = style.full_name_postscript
-                    style.dirty = True
-        else:
-            for style in styles:
-                style.prepare(whole_directory=True)
-
-        for style in styles:
-            if hasattr(style, "postprocess"):
-                style.postprocess()
-                style.refresh_groups()
+            kit.copy(style.master.write(), style.get_path())
+            if style.file_format == "UFO":
+                style.open().info.postscriptFontName = style.full_name_postscript
                 style.dirty = True
-            style.save()
+        else:
+            style.prepare(whole_directory=True)
+
+        if hasattr(style, "postprocess"):
+            style.postprocess()
+            style.refresh_groups()
+            style.dirty = True
+        style.save()
+
+        if key:
+            p.cache.store(key, [style.write()])
+
+    def generate_styles(self, styles=None):
+        """
+        :param styles: Styles to interpolate, all by default. The designspace must be prepared first, see `prepare_designspace`.
+        """
+        styles = kit.fallback(styles, self.styles)
+        if self.project.options["use_numpy_interpolation"]:
+            # The masters are packed once for all styles. defcon loads them lazily, which isn't thread-safe:
+            with self._lock:
+                if self._interpolator is None:
+                    self._interpolator = kit.Interpolator(self)
+                self._interpolator.generate(styles)
+            return
+        if self.project.options["generate_instances_in_process"]:
+            self.project.designspace.generate_instances(styles)
+            return
+        instance_styles = self.get_instance_styles()
+        # makeInstancesUFO writes the instances it is asked for to a temporary designspace next to the designspace:
+        with self._lock:
+            self.project.instrumentation.call(
+                [
+                    "makeInstancesUFO",
+                    "-v",
+                    "-d", self.project.designspace.get_path(),
+                    "-a",
+                    "-c",
+                    "-n",
+                    "-i", ",".join(str(instance_styles.index(i)) for i in styles),
+                ],
+                outputs = [os.path.join("intermediates", "instances")],
+            )
+        self.move_instances_ufo_to_intermediate_style(styles)
 
-    def generate_styles(self):
-        self.project.designspace.prepare()
-        subprocess.call([
-            "makeInstancesUFO",
-            "-v",
-            "-d", self.project.designspace.get_path(),
-            "-a",
-            "-c",
-            "-n",
-        ])
-        self.move_instances_ufo_to_intermediate_style()
-
-    def move_instances_ufo_to_intermediate_style(self):
-        for style in self.styles:
-            shutil.copytree(
+    def move_instances_ufo_to_intermediate_style(self, styles=None):
+        for style in kit.fallback(styles, self.styles):
+            kit.copy(
                 os.path.join('intermediates', 'instances', f'{style.full_name_postscript}.{style.extension}'),
                 os.path.join('intermediates', 'styles', f'{style.name}', f'font.{style.extension}')
             )
@@ -133,6 +220,58 @@ class DesignSpace(kit.BaseFile):
             os.path.abspath(kit.relative_to_cwd(self.get_path()))
         )
 
+    @staticmethod
+    def get_location(location):
+        return mutatorMath.objects.location.Location(**{
+            "axis " + str(axis_number): axis_position
+            for axis_number, axis_position in enumerate(location)
+        })
+
+    @staticmethod
+    def generate_instance(designspace_path, instance_name):
+        """Interpolate the instance named `instance_name` into its UFO, in a worker process."""
+        reader = mutatorMath.ufo.document.DesignSpaceDocumentReader(
+            designspace_path,
+            ufoVersion = 3,
+            roundGeometry = True,
+        )
+        reader.readInstance(("name", instance_name))
+
+    def generate_instances(self, styles):
+        """
+        In-process replacement for `makeInstancesUFO -a -c -n`: each style is interpolated in its own worker process, straight into its path.
+        """
+        designspace_path = os.path.abspath(kit.relative_to_cwd(self.get_path()))
+        instance_names = ["instance " + i.name for i in styles]
+        for style in styles:
+            kit.remove(style.get_path())
+        max_workers = min(
+            kit.fallback(self.project.options["max_workers"], os.cpu_count()),
+            len(styles),
+        )
+        with self.project.instrumentation.measure(
+            "mutatorMath",
+            kind = "subprocess",
+            outputs = [i.get_path() for i in styles],
+        ):
+            if max_workers > 1:
+                # Forking, as spawning would run the build script again.
+                with concurrent.futures.ProcessPoolExecutor(
+                    max_workers = max_workers,
+                    mp_context = multiprocessing.get_context("fork"),
+                ) as executor:
+                    list(executor.map(
+                        self.generate_instance,
+                        [designspace_path] * len(styles),
+                        instance_names,
+                    ))
+            else:
+                for instance_name in instance_names:
+                    self.generate_instance(designspace_path, instance_name)
+        for style in styles:
+            style.defconFont = None
+            print("[GENERATED]", style.get_path())
+
     def generate(self):
 
         for i, master in enumerate(self.project.family.masters):
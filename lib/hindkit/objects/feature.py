@@ -1,4 +1,5 @@
-import os, collections, itertools, re
+import os, collections, re, json, bisect
+import numpy
 import WriteFeaturesKernFDK, WriteFeaturesMarkFDK
 import hindkit as kit
 
@@ -22,9 +23,11 @@ class BaseFeature(kit.BaseFile):
 
     @staticmethod
     def sort_names(names, order):
+        names_set = set(names)
+        order_set = set(order)
         return (
-            [i for i in order if i in names] +
-            [i for i in names if i not in order]
+            [i for i in order if i in names_set] +
+            [i for i in names if i not in order_set]
         )
 
     @staticmethod
@@ -275,11 +278,18 @@ class FeatureKern(BaseFeature):
 
     _name = "kern"
 
+    def get_cache_inputs(self):
+        return [self.style.write()], [self.project.options["min_kern"]]
+
+    def get_cache_outputs(self):
+        return [self.get_path(), os.path.join(self.get_directory(), "dist.fea")]
+
     def generate(self):
         WriteFeaturesKernFDK.kKernFeatureFileName = self.filename_with_extension
         WriteFeaturesKernFDK.KernDataClass(
             font = self.style.open(),
             folderPath = self.style.get_directory(),
+            minKern = kit.fallback(self.project.options["min_kern"], WriteFeaturesKernFDK.kDefaultMinKern),
         )
         if hasattr(self, "postprocess"):
             kern_path = self.get_path()
@@ -299,6 +309,21 @@ class FeatureMark(BaseFeature):
 
     _name = "mark"
 
+    def get_cache_inputs(self):
+        return [self.style.write()], []
+
+    def get_cache_outputs(self):
+        return [
+            os.path.join(self.style.get_directory(), i)
+            for i in [
+                WriteFeaturesMarkFDK.kMarkClassesFileName,
+                WriteFeaturesMarkFDK.kMarkFeatureFileName,
+                WriteFeaturesMarkFDK.kMkmkFeatureFileName,
+                WriteFeaturesMarkFDK.kAbvmFeatureFileName,
+                WriteFeaturesMarkFDK.kBlwmFeatureFileName,
+            ]
+        ]
+
     def generate(self):
         WriteFeaturesMarkFDK.kMarkFeatureFileName = self.filename_with_extension
         WriteFeaturesMarkFDK.MarkDataClass(
@@ -346,17 +371,6 @@ class FeatureMatches(BaseFeature):
 
     _name = "mI_variant_matches"
 
-    class Base(object):
-        def __init__(self, feature, base_glyph_sequence):
-            self.glyphs = base_glyph_sequence
-            self.target = None
-            for g in reversed(self.glyphs):
-                #TODO: Kerning.
-                if self.target is None:
-                    self.target = feature._get_stem_position(g)
-                else:
-                    self.target += g.width
-
     class Match(object):
         def __init__(self, feature, mI_variant_name):
             self.name = mI_variant_name
@@ -364,7 +378,22 @@ class FeatureMatches(BaseFeature):
                 self.mI_variant = feature.font[self.name]
                 self.tag = self.mI_variant.name.partition(".")[2]
                 self.overhanging = abs(self.mI_variant.rightMargin)
-            self.bases = []
+            # Alive bases grouped by the dead bases they follow:
+            self.alive_bases_by_prefix = {}
+
+        def add(self, prefix, alive_bases):
+            self.alive_bases_by_prefix.setdefault(prefix, []).extend(alive_bases)
+
+        @property
+        def bases(self):
+            """
+            :return: Glyph sequences, dead bases followed by an alive base.
+            """
+            return [
+                prefix + (i,)
+                for prefix, alive_bases in self.alive_bases_by_prefix.items()
+                for i in alive_bases
+            ]
 
     CLASS_NAME_mI_VARIANTS = "mI_VARIANTS"
     CLASS_NAME_BASES_ALIVE = "BASES_ALIVE"
@@ -385,11 +414,50 @@ class FeatureMatches(BaseFeature):
     mI_ANCHOR_NAME = "abvm.i"
     POTENTIAL_abvm_ANCHOR_NAMES = ["abvm.e", "abvm"]
 
+    MARK_POSITIONING_FILENAME = "mI_variant_mark_positioning.json"
+
     def __init__(self, project, style=None):
         super().__init__(project, style=style)
         self._bases_alive = None
         self._bases_dead = None
 
+    def get_cache_inputs(self):
+        return [
+            self.style.write(),
+            os.path.join(self.style.get_directory(), WriteFeaturesMarkFDK.kAbvmFeatureFileName),
+        ], [
+            self.style.adjustment_for_matching_mI_variants,
+            self.project.adjustment_for_matching_mI_variants,
+            self.project.script_abbr_current,
+            self._bases_alive and [i.name for i in self._bases_alive],
+            self._bases_dead and [i.name for i in self._bases_dead],
+        ]
+
+    def get_cache_outputs(self):
+        abvm_filename = WriteFeaturesMarkFDK.kAbvmFeatureFileName
+        return [
+            self.get_path(),
+            os.path.join(self.style.get_directory(), abvm_filename),
+            os.path.join(self.style.get_directory(), "backup--" + abvm_filename),
+            self.get_mark_positioning_path(self.style),
+        ]
+
+    @classmethod
+    def get_mark_positioning_path(cls, style):
+        return os.path.join(style.get_directory(), cls.MARK_POSITIONING_FILENAME)
+
+    @classmethod
+    def read_mark_positioning(cls, style):
+        """
+        :return: Base overrides for `kit.MarkLookupBuilder`, from the file written by `output_mark_positioning_for_mI_variants`, or None.
+        """
+        path = cls.get_mark_positioning_path(style)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            mI_variant_to_bases = json.load(f)
+        return {cls.mI_ANCHOR_NAME: {k: tuple(v) for k, v in mI_variant_to_bases.items()}}
+
     def generate(self):
 
         self.font = self.style.open()
@@ -399,6 +467,9 @@ class FeatureMatches(BaseFeature):
             raise ValueError("[WARNING] No variants for mI.")
         # The order in glyph classes can't be trusted:
         self.matches = [self.Match(self, i) for i in sorted(mI_variant_names)]
+        # Normally also in the order of names:
+        self.matches_by_overhanging = sorted(self.matches, key=lambda i: i.overhanging)
+        self.overhangings = [i.overhanging for i in self.matches_by_overhanging]
         # self.not_matched = self.Match(self, None)
 
         abvm_position_in_mE = self._get_abvm_position(
@@ -410,40 +481,25 @@ class FeatureMatches(BaseFeature):
         else:
             self.abvm_right_margin = abs(abvm_position_in_mE)
 
-        self.bases = [self.Base(self, i) for i in self._base_glyph_sequences()]
-        if not self.bases:
-            raise ValueError("[WARNING] No bases.")
-
-        adjustment = self._get_adjustment()
-        if adjustment is None:
-            pass
-        elif isinstance(adjustment, tuple):
-            extremes = adjustment
-            targets = [base.target for base in self.bases]
-            TARGET_MIN = min(targets)
-            TARGET_MAX = max(targets)
-            for i, base in enumerate(self.bases):
-                ratio = (base.target - TARGET_MIN) / (TARGET_MAX - TARGET_MIN)
-                adjustment = extremes[0] + (extremes[1] - extremes[0]) * ratio
-                self.bases[i].target += adjustment
-        else:
-            for i, base in enumerate(self.bases):
-                self.bases[i].target += adjustment
-
         self.tolerance = self._get_stem_position(
             self.font[self.project.script_abbr_current + "VA"]
         ) * 0.5
 
-        for base in self.bases:
-            match = self.match_mI_variants(base)
-            if match:
-                match.bases.append(base)
+        self._match_base_glyph_sequences()
 
         self.name_default = self.project.script_abbr_current + "mI"
 
+        self.glyph_order = {}
+        for i, g in enumerate(self.bases_dead + self.bases_alive):
+            self.glyph_order.setdefault(g.name, i)
+        self.rule_count_before = 0
         self.substitute_rule_lines = []
         for match in self.matches:
             self.output_mI_variant_matches(match)
+        print("[mI VARIANT MATCHES] {} rules, minimized from {}".format(
+            sum(1 for l in self.substitute_rule_lines if not l.startswith("#")),
+            self.rule_count_before,
+        ))
         with open(self.get_path(), "w") as f:
             f.writelines([
                 "lookup %s {\n" % self.name,
@@ -513,90 +569,205 @@ class FeatureMatches(BaseFeature):
             [self.font[i] for i in self.font.groups.get(self.CLASS_NAME_BASES_DEAD, [])]
         )
 
-    def _base_glyph_sequences(self):
-        seeds = [self.bases_dead] * (self.project.options["match_mI_variants"] - 1) + [self.bases_alive]
-        for sequence in itertools.product(*seeds):
-            yield sequence
+    def _match_base_glyph_sequences(self):
+        """
+        Match the sequences of `itertools.product(bases_dead, ..., bases_alive)` to mI variants, in that order, without building them all.
+        The dead bases are walked depth first, sharing the width of each prefix, and the last level is matched with all alive bases at once. Prefixes too wide for the longest variant are pruned.
+        """
+
+        depth = self.project.options["match_mI_variants"] - 1
+        bases_alive = self.bases_alive
+        bases_dead = self.bases_dead if depth else []
+        if not bases_alive or (depth and not bases_dead):
+            raise ValueError("[WARNING] No bases.")
+
+        #TODO: Kerning.
+        alive_targets = numpy.array([self._get_stem_position(g) for g in bases_alive], dtype=numpy.float64)
+        dead_widths = numpy.array([g.width for g in bases_dead], dtype=numpy.float64)
+        dead_width_min = dead_widths.min() if depth else 0
+        dead_width_max = dead_widths.max() if depth else 0
+        # Over all sequences, as a tuple adjustment is relative to them:
+        TARGET_MIN = alive_targets.min() + depth * dead_width_min
+        TARGET_MAX = alive_targets.max() + depth * dead_width_max
+
+        adjustment = self._get_adjustment()
+        can_prune = True
+        if adjustment is None:
+            adjust = lambda targets: targets
+        elif isinstance(adjustment, tuple):
+            extremes = adjustment
+            target_range = (TARGET_MAX - TARGET_MIN) or 1
+            adjust = lambda targets: targets + (
+                extremes[0] + (extremes[1] - extremes[0]) * ((targets - TARGET_MIN) / target_range)
+            )
+            # Wider sequences must still end up with larger targets:
+            can_prune = (extremes[1] - extremes[0]) / target_range > -1
+        else:
+            adjust = lambda targets: targets + adjustment
+
+        # A little slack, as the sums are added up in different orders:
+        target_limit = self.overhangings[-1] + self.tolerance + 1e-6
+
+        def match(prefixes, prefix_widths):
+            targets = adjust((prefix_widths[:, numpy.newaxis] + alive_targets).ravel())
+            indices = self.match_mI_variants_all(targets).reshape(len(prefixes), len(bases_alive))
+            for prefix, row in zip(prefixes, indices.tolist()):
+                alive_bases_by_index = {}
+                for g, i in zip(bases_alive, row):
+                    if i >= 0:
+                        alive_bases_by_index.setdefault(i, []).append(g)
+                for i, alive_bases in alive_bases_by_index.items():
+                    self.matches_by_overhanging[i].add(prefix, alive_bases)
+
+        def walk(prefix, prefix_width):
+            remaining = depth - len(prefix)
+            widths = prefix_width + dead_widths
+            if can_prune:
+                lower_bounds = adjust(widths + ((remaining - 1) * dead_width_min + alive_targets.min()))
+                candidates = numpy.flatnonzero(lower_bounds <= target_limit)
+            else:
+                candidates = numpy.arange(len(bases_dead))
+            if remaining == 1:
+                match([prefix + (bases_dead[i],) for i in candidates.tolist()], widths[candidates])
+            else:
+                for i in candidates.tolist():
+                    walk(prefix + (bases_dead[i],), widths[i])
+
+        if depth:
+            walk((), 0.0)
+        else:
+            match([()], numpy.zeros(1))
 
     def match_mI_variants(self, base):
-        if base.target <= self.matches[0].overhanging:
-            return self.matches[0]
-        elif base.target < self.matches[-1].overhanging:
-            i = 0
-            while self.matches[i].overhanging < base.target:
-                candidate_short = self.matches[i]
-                i += 1
-            candidate_enough = self.matches[i]
-            if (
-                (candidate_enough.overhanging - base.target) <
-                (base.target - candidate_short.overhanging) / 3
-            ):
-                return candidate_enough
+        overhangings = self.overhangings
+        if base.target <= overhangings[0]:
+            return self.matches_by_overhanging[0]
+        elif base.target < overhangings[-1]:
+            i = bisect.bisect_left(overhangings, base.target)
+            # Prefer the shorter variant unless the longer one is three times closer:
+            if (overhangings[i] - base.target) < (base.target - overhangings[i - 1]) / 3:
+                return self.matches_by_overhanging[i]
             else:
-                return candidate_short
-        elif base.target <= self.matches[-1].overhanging + self.tolerance:
-            return self.matches[-1]
+                return self.matches_by_overhanging[i - 1]
+        elif base.target <= overhangings[-1] + self.tolerance:
+            return self.matches_by_overhanging[-1]
         else:
             # return self.not_matched
             return
 
+    def match_mI_variants_all(self, targets):
+        """
+        `match_mI_variants` for all `targets` at once.
+        :return: Array of indices in `self.matches_by_overhanging`, -1 where nothing matches.
+        """
+        overhangings = numpy.array(self.overhangings, dtype=numpy.float64)
+        targets = numpy.asarray(targets, dtype=numpy.float64)
+        last = len(overhangings) - 1
+        # For targets in between, the longer and the shorter candidates are i and i - 1:
+        if last:
+            i = numpy.clip(numpy.searchsorted(overhangings, targets, side="left"), 1, last)
+        else:
+            i = numpy.zeros(len(targets), dtype=numpy.intp)
+        indices = numpy.where(
+            (overhangings[i] - targets) < (targets - overhangings[i - 1]) / 3,
+            i,
+            i - 1,
+        )
+        is_long = targets >= overhangings[-1]
+        indices[is_long] = numpy.where(targets[is_long] <= overhangings[-1] + self.tolerance, last, -1)
+        # Last, as the shortest variant comes first in `match_mI_variants` even when all are equally long:
+        indices[targets <= overhangings[0]] = 0
+        return indices
+
     def output_mI_variant_matches(self, match):
 
-        if not match.bases:
+        if not match.alive_bases_by_prefix:
             print("\t\t`{}` is not used.".format(match.name))
             self.substitute_rule_lines.append(
                 "# sub {}' _ by {};".format(self.name_default, match.name),
             )
             return
 
-        single_glyph_bases = []
-        multiple_glyph_bases = []
-        for base in match.bases:
-            if len(base.glyphs) == 1:
-                single_glyph_bases.append(base)
-            else:
-                multiple_glyph_bases.append(base)
-
-        if single_glyph_bases:
-            self.substitute_rule_lines.append(
-                "sub {}' [{}] by {};".format(
-                    self.name_default,
-                    " ".join(i.glyphs[0].name for i in single_glyph_bases),
-                    match.name,
-                ),
-            )
-
-        def compress(raw):
-            compressed = {}
-            for k, v in raw:
-                if k in compressed:
-                    compressed[k].extend(v)
-                else:
-                    compressed[k] = v
-            return compressed
-
-        compressed = compress(
-            (tuple(i.glyphs[:1]), i.glyphs[1:]) for i in multiple_glyph_bases
-        )
-        compressed = compress(
-            (tuple(v), list(k)) for k, v in list(compressed.items())
-        )
-
-        for rule in ([v, list(k)] for k, v in list(compressed.items())):
+        sequences = {
+            tuple(g.name for g in prefix) + (i.name,)
+            for prefix, alive_bases in match.alive_bases_by_prefix.items()
+            for i in alive_bases
+        }
+        # What grouping only the last dead bases would give:
+        self.rule_count_before += len({
+            (tuple(g.name for g in prefix[:-1]), tuple(i.name for i in alive_bases))
+            for prefix, alive_bases in match.alive_bases_by_prefix.items()
+        })
+
+        for rule in self.minimize_rules(sequences, self.glyph_order):
             self.substitute_rule_lines.append(
                 "sub {}' {} by {};".format(
                     self.name_default,
                     " ".join(
-                        i[0].name if len(i) == 1
-                        else "[{}]".format(" ".join(j.name for j in i))
+                        i[0] if len(i) == 1
+                        else "[{}]".format(" ".join(i))
                         for i in rule
                     ),
                     match.name,
                 ),
             )
 
+    @staticmethod
+    def minimize_rules(sequences, order):
+        """
+        Factor glyph name sequences of the same length into class-based rules, like a DAWG.
+        At each position, glyphs followed (or preceded) by the same set of sequences share a class, factoring from whichever end gives fewer rules.
+        :param order: Glyph name to sort key, for stable classes.
+        :return: List of rules, each a list of glyph name lists, covering exactly `sequences`.
+        """
+
+        minimized = {}
+
+        def factor(sequences, from_end):
+            rests_by_glyph = {}
+            for sequence in sequences:
+                if from_end:
+                    glyph, rest = sequence[-1], sequence[:-1]
+                else:
+                    glyph, rest = sequence[0], sequence[1:]
+                rests_by_glyph.setdefault(glyph, set()).add(rest)
+            glyphs_by_rests = {}
+            for glyph in sorted(rests_by_glyph, key=order.get):
+                glyphs_by_rests.setdefault(frozenset(rests_by_glyph[glyph]), []).append(glyph)
+            rules = []
+            for rests, glyphs in glyphs_by_rests.items():
+                for rule in minimize(rests):
+                    rules.append(rule + [glyphs] if from_end else [glyphs] + rule)
+            return rules
+
+        def minimize(sequences):
+            if sequences not in minimized:
+                if len(next(iter(sequences))) == 1:
+                    rules = [[sorted((i for i, in sequences), key=order.get)]]
+                else:
+                    rules = min(factor(sequences, False), factor(sequences, True), key=len)
+                minimized[sequences] = rules
+            return minimized[sequences]
+
+        return minimize(frozenset(sequences)) if sequences else []
+
     def output_mark_positioning_for_mI_variants(self):
 
+        if self.project.options["build_mark_lookups_directly"]:
+            # The abvm.i anchor of each mI variant goes to the bases it matches, moved by the width of the first variant:
+            x_offset = -self.matches[0].mI_variant.width
+            with open(self.get_mark_positioning_path(self.style), "w") as f:
+                json.dump(
+                    {
+                        match.name: [[i[0].name for i in match.bases], x_offset]
+                        for match in self.matches
+                    },
+                    f,
+                    indent = 2,
+                    sort_keys = True,
+                )
+            return
+
         abvm_backup_path = os.path.join(
             self.style.get_directory(),
             "backup--" + WriteFeaturesMarkFDK.kAbvmFeatureFileName,
@@ -618,7 +789,7 @@ class FeatureMatches(BaseFeature):
             match = match_dict[matchobj.group(1).partition(".")[2]]
             if match.bases:
                 prefix = ""
-                names = "[{}]".format(" ".join(i.glyphs[0].name for i in match.bases))
+                names = "[{}]".format(" ".join(i[0].name for i in match.bases))
             else:
                 prefix = "# "
                 names = "_"
@@ -683,18 +854,19 @@ class FeatureReferences(BaseFeature):
                         if i is self.project.feature_gpos:
                             has_referred_gpos = True
             if not has_referred_gpos:
-                if os.path.exists(os.path.join(self.project.feature_kern.get_directory(), "dist.fea")):
+                feature_kern = FeatureKern(self.project, style=self.style)
+                if os.path.exists(os.path.join(feature_kern.get_directory(), "dist.fea")):
                     lines.append(
                         "feature %(tag)s { include(%(path)s); } %(tag)s;" % {
                             "tag": "dist",
-                            "path": os.path.relpath(os.path.join(self.project.feature_kern.get_directory(), "dist.fea"), self.style.get_directory()),
+                            "path": os.path.relpath(os.path.join(feature_kern.get_directory(), "dist.fea"), self.style.get_directory()),
                         }
                     )
-                if os.path.exists(self.project.feature_kern.get_path()):
+                if os.path.exists(feature_kern.get_path()):
                     lines.append(
                         "feature %(tag)s { include(%(path)s); } %(tag)s;" % {
                             "tag": "kern",
-                            "path": os.path.relpath(self.project.feature_kern.get_path(), self.style.get_directory()),
+                            "path": os.path.relpath(feature_kern.get_path(), self.style.get_directory()),
                         }
                     )
                 if os.path.exists(os.path.join(self.style.get_directory(), WriteFeaturesMarkFDK.kMarkClassesFileName)):
@@ -2,12 +2,16 @@ import collections
 import glob
 import itertools
 import os
+import plistlib
+import shutil
 import subprocess
 
 import defcon
+from defcon.pens.decomposeComponentPointPen import DecomposeComponentPointPen
 import fontTools.ttLib
 import getKerningPairsFromFEA
 import ufo2ft
+import WriteFeaturesKernFDK
 
 from afdko.makeinstancesufo import logger, normalizeUFO, updateInstance, validateLayers
 
@@ -52,6 +56,7 @@ class BaseFont(kit.BaseFile):
         self._full_name_postscript = None
 
         self.defconFont = None
+        self._unwritten = False
 
         self.adjustment_for_matching_mI_variants = None
         self.glyph_renaming_map = {}
@@ -94,22 +99,106 @@ class BaseFont(kit.BaseFile):
             else:
                 raise SystemExit("`{}` is missing.".format(self.get_path()))
 
+    def _get_project_option(self, key):
+        """
+        :return: The option of the project this font belongs to, or False for a font without a project.
+        """
+        project = self.project or (self.family and self.family.project)
+        if not project:
+            return False
+        return project.options[key]
+
+    def get_next_filename(self):
+        """:return: Filename the next version is saved as by `save`."""
+        filename, self._filename = self._filename, None
+        try:
+            return self.filename + "--{}".format(self.counter + 1)
+        finally:
+            self._filename = filename
+
     def save(self, defconFont=None, as_filename=None):
         if not defconFont:
             if self.defconFont:
                 defconFont = self.defconFont
             else:
                 return
+        self._filename = kit.fallback(as_filename, self.get_next_filename())
         self.counter += 1
-        if as_filename is None:
-            self._filename = None
-            self._filename = self.filename + "--{}".format(self.counter)
-        else:
-            self._filename = as_filename
-        defconFont.save(self.get_path())
+        if self._get_project_option("keep_fonts_in_memory"):
+            self.defconFont = defconFont
+            self._unwritten = True
+            print("[SAVED IN MEMORY]", self.get_path())
+            return
+        self._write(defconFont)
         self.defconFont = None
         print("[SAVED]", self.get_path())
 
+    def write(self):
+        """
+        Write the font kept in memory by `save` to disk, for tools reading it from there.
+        :return: The path.
+        """
+        if self._unwritten:
+            self._write(self.defconFont)
+            self._unwritten = False
+            print("[WRITTEN]", self.get_path())
+        return self.get_path()
+
+    def _write(self, defconFont):
+        if self._get_project_option("save_incrementally") and self._carry_over(defconFont, self.get_path()):
+            defconFont.save()
+        else:
+            defconFont.save(self.get_path())
+
+    @staticmethod
+    def _link_or_copy(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    def _carry_over(self, defconFont, path):
+        """
+        Prepare `path` for an in-place save of `defconFont`, so only its changed objects get written: the previous version of the UFO is copied to `path` with its .glif files hard-linked, then the .glif files of changed glyphs are unlinked so writing them won't alter the previous version.
+        :return: False if there is no previous version to carry over from.
+        """
+        previous_path = defconFont.path
+        if (
+            previous_path is None
+            or not os.path.isdir(previous_path)
+            or os.path.exists(path)
+            # Don't link to files outside intermediates, e.g. sources being edited.
+            or not os.path.abspath(previous_path).startswith(
+                os.path.abspath(kit.Project.directories["intermediates"]) + os.sep
+            )
+        ):
+            return False
+        layer_contents_path = os.path.join(previous_path, "layercontents.plist")
+        if os.path.exists(layer_contents_path):
+            with open(layer_contents_path, "rb") as f:
+                layer_directories = dict(plistlib.load(f))
+        else:
+            layer_directories = {defconFont.layers.defaultLayer.name: "glyphs"}
+        if any(layer.name not in layer_directories for layer in defconFont.layers):
+            return False
+        shutil.copytree(
+            previous_path,
+            path,
+            copy_function = lambda src, dst: (
+                self._link_or_copy(src, dst) if src.endswith(".glif") else shutil.copy2(src, dst)
+            ),
+        )
+        for layer in defconFont.layers:
+            directory = os.path.join(path, layer_directories[layer.name])
+            with open(os.path.join(directory, "contents.plist"), "rb") as f:
+                contents = plistlib.load(f)
+            # Only loaded glyphs can be dirty, and loading the others would defeat the purpose.
+            for glyph_name, glyph in layer._glyphs.items():
+                if glyph.dirty and glyph_name in contents:
+                    kit.remove(os.path.join(directory, contents[glyph_name]))
+        defconFont._path = path
+        return True
+
     def import_from_font(
         self,
         source_path,
@@ -147,16 +236,19 @@ class BaseFont(kit.BaseFile):
             kern_classes_reversed = {tuple(v): k for k, v in list(kern_fea_reader.kernClasses.items())}
             if len(kern_fea_reader.kernClasses) != len(kern_classes_reversed):
                 raise SystemExit()
-            for enum, (left, right), value in reversed(kern_fea_reader.foundKerningPairs):
+            # Pairs stay at the class level, and the first command for a pair wins:
+            kerning = {}
+            for enum, (left, right), value in kern_fea_reader.foundKerningPairs:
                 pair = []
                 for side in left, right:
                     parts = side.split()
                     if tuple(parts) in kern_classes_reversed:
                         parts = [kern_classes_reversed[tuple(parts)]]
                     pair.append(parts)
-                pairs = list(itertools.product(*pair))
-                for pair in pairs:
-                    source_font.kerning[pair] = int(value)
+                value = int(value)
+                for pair in itertools.product(*pair):
+                    kerning.setdefault(pair, value)
+            source_font.kerning.update(kerning)
         else:
             raise SystemExit("The format of {} is not supported.".format(source_path))
 
@@ -186,32 +278,57 @@ class BaseFont(kit.BaseFile):
             if g_names_excluded:
                 g_names_importing.difference_update(g_names_excluded)
                 print("Excluding: {}".format(", ".join(g_names_excluded)))
-            g_names_importing_renamed
             g_names_already_existing = g_names_importing_renamed.intersection(set(target_font.keys()))
             if g_names_already_existing:
                 g_names_importing.difference_update(g_names_already_existing)
                 print("Already existing; will not overwrite: {}".format(", ".join(g_names_already_existing)))
+            source_g_order = set(source_font.glyphOrder)
             g_names_importing = (
                 [i for i in source_font.glyphOrder if i in g_names_importing]
-                + [i for i in g_names_importing if i not in source_font.glyphOrder]
+                + [i for i in g_names_importing if i not in source_g_order]
             )
+
+            # Components referring to glyphs left behind are decomposed, in the copies only:
+            g_names_importing_set = set(g_names_importing)
+            base_g_names_decomposing = {
+                source_g_name: {
+                    component.baseGlyph for component in source_font[source_g_name].components
+                    if component.baseGlyph not in g_names_importing_set
+                }
+                for source_g_name in g_names_importing
+            }
+            source_layer = source_font.layers.defaultLayer
+
+            renamed_count = 0
             for source_g_name in g_names_importing:
                 source_g = source_font[source_g_name]
-                if not import_anchors:
-                    source_g.clearAnchors()
-                for component in source_g.components:
-                    if component.baseGlyph not in g_names_importing:
-                        source_g.decomposeComponent(component)
-                        print("(decomposed {} in {})".format(component.baseGlyph, source_g_name), end=" ")
                 target_g_name = self.glyph_renaming_map.get(source_g_name, source_g_name)
+                if target_g_name != source_g_name:
+                    renamed_count += 1
                 target_font.newGlyph(target_g_name)
                 target_g = target_font[target_g_name]
+                # One round of notifications per glyph, instead of one per contour, component and anchor:
+                target_g.holdNotifications(note="Requested by BaseFont.import_from_font.")
                 target_g.copyDataFromGlyph(source_g)
-                if target_g_name == source_g_name:
-                    print(target_g_name, end=", ")
-                else:
-                    print("{} -> {}".format(source_g_name, target_g_name), end=", ")
-            print()
+                if not import_anchors:
+                    target_g.clearAnchors()
+                if base_g_names_decomposing[source_g_name]:
+                    point_pen = DecomposeComponentPointPen(target_g, source_layer)
+                    point_pen.skipConflictingIdentifiers = True
+                    for component in list(target_g.components):
+                        if component.baseGlyph in base_g_names_decomposing[source_g_name]:
+                            component.drawPoints(point_pen)
+                            target_g.removeComponent(component)
+                target_g.releaseHeldNotifications()
+
+            decomposed = [
+                "{} in {}".format(base_g_name, source_g_name)
+                for source_g_name, base_g_names in base_g_names_decomposing.items()
+                for base_g_name in sorted(base_g_names)
+            ]
+            print("Imported {} glyphs ({} renamed).".format(len(g_names_importing), renamed_count))
+            if decomposed:
+                print("Decomposed: {}".format(", ".join(decomposed)))
 
         # TODO: Component reference and glyph group reference both need to be updated.
 
@@ -279,19 +396,26 @@ class BaseFont(kit.BaseFile):
         print(font.groups)
 
         kerning_modified = {}
+        valid_side_names = set(font.groups.keys())
+        valid_side_names.update(font.keys())
+        side_name_modified_cache = {}
 
         for pair, value in font.kerning.items():
 
-            valid_side_mames = list(font.groups.keys()) + list(font.keys())
             pair_modified = []
 
             for side, side_name in enumerate(pair):
-                side_name_modified = kerning_side_renaming_map.get((side, side_name), side_name)
-                side_name_modified = self.glyph_renaming_map.get(side_name_modified, side_name_modified)
-                if side_name_modified in valid_side_mames:
-                    pair_modified.append(side_name_modified)
-                else:
+                try:
+                    side_name_modified = side_name_modified_cache[side, side_name]
+                except KeyError:
+                    side_name_modified = kerning_side_renaming_map.get((side, side_name), side_name)
+                    side_name_modified = self.glyph_renaming_map.get(side_name_modified, side_name_modified)
+                    if side_name_modified not in valid_side_names:
+                        side_name_modified = None
+                    side_name_modified_cache[side, side_name] = side_name_modified
+                if side_name_modified is None:
                     break
+                pair_modified.append(side_name_modified)
             else:
                 kerning_modified[tuple(pair_modified)] = value
 
@@ -461,11 +585,77 @@ class Product(BaseFont):
 
         self.goadb_trimmed = kit.Goadb(self.project, product=self)
         self.goadb_trimmed.prepare()
+
+        cache = self.project.cache
+        key = None
+        if cache:
+            key = cache.get_key(
+                "product " + self.get_path(),
+                paths = (
+                    [self.style.write()] +
+                    self.project.get_feature_paths(self.style) +
+                    [self.goadb_trimmed.get_path(), self.project.fmndb.get_path()]
+                ),
+                values = [self.file_format, self.subsidiary],
+            )
+            # Compiling an OTF from a UFO also prepares the UFO for the other products of the style, as its next version, so the prepared UFO is cached with it:
+            prepared_filename = None
+            outputs = [self.get_path()]
+            if self.file_format == "OTF" and self.style.file_format == "UFO":
+                prepared_filename = self.style.get_next_filename()
+                outputs.append(os.path.join(
+                    self.style.get_directory(),
+                    prepared_filename + "." + self.style.extension,
+                ))
+
+        if key and cache.restore(key, outputs):
+            self.built = True
+            if prepared_filename:
+                self.style._filename = prepared_filename
+                self.style.counter += 1
+                self.style.defconFont = None
+            print("[RESTORED FROM CACHE]", self.get_path())
+        else:
+            self._compile()
+            if key and self.built:
+                cache.store(key, outputs)
+
+        if self.built:
+
+            self.copy_out_of_temp()
+
+            output_dir = self.project.directories["output"]
+            if os.path.isdir(output_dir):
+                kit.copy(
+                    self.get_path(),
+                    os.path.join(output_dir, self.filename_with_extension),
+                )
+                print("[COPIED TO OUPUT DIRECTORY]", self.get_path())
+
+    def _compile(self):
+
         style_file_format_backup = None
+        kern_lookup_builder = None
+        mark_lookup_builder = None
 
         if self.file_format == "OTF" and self.style.file_format == "UFO":
 
             font = self.style.open()
+            if self.project.options["prepare_kerning"] and self.project.is_building_kern_lookups_directly():
+                kern_lookup_builder = kit.KernLookupBuilder(
+                    font.kerning,
+                    font.groups,
+                    min_kern = kit.fallback(self.project.options["min_kern"], WriteFeaturesKernFDK.kDefaultMinKern),
+                    rename = self.goadb_trimmed.get_renaming_map(),
+                )
+            if self.project.options["prepare_mark_positioning"] and self.project.options["build_mark_lookups_directly"]:
+                mark_lookup_builder = kit.MarkLookupBuilder(
+                    font,
+                    mkmk = self.project.options["prepare_mark_to_mark_positioning"],
+                    indic = self.project.family.script.is_indic,
+                    base_overrides = kit.FeatureMatches.read_mark_positioning(self.style),
+                    rename = self.goadb_trimmed.get_renaming_map(),
+                )
             font.info.postscriptFontName = self.full_name_postscript
             font.lib["public.glyphOrder"] = self.goadb_trimmed.names
             for glyph in font:
@@ -473,6 +663,9 @@ class Product(BaseFont):
             font.groups.clear()
             font.kerning.clear()
             self.style.save()
+            self.style.write()
+            # The tools below modify the UFO on disk:
+            self.style.defconFont = None
 
             # from afdko/makeinstancesufo.py:
 
@@ -552,7 +745,7 @@ class Product(BaseFont):
                 arguments.append("-osbOn" if boolean else "-osbOff")
                 arguments.append(digit)
 
-        subprocess.call(["makeotf"] + arguments)
+        self.project.instrumentation.call(["makeotf"] + arguments, outputs=[self.get_path()])
 
         if style_file_format_backup:
             self.style.file_format = style_file_format_backup
@@ -570,21 +763,34 @@ class Product(BaseFont):
                 if table_tag in self.font:
                     del self.font[table_tag]
                     dirty = True
+            if kern_lookup_builder:
+                kern_lookup_builder.add_to_font(
+                    self.font,
+                    "kern",
+                    kern_lookup_builder.build(self.font.getReverseGlyphMap()),
+                    script_tags = self.project.family.script.tags,
+                )
+                dirty = True
+                print(
+                    "[KERN LOOKUPS BUILT] {} glyph pairs, {} class pairs, {} trimmed".format(
+                        kern_lookup_builder.glyph_pair_count,
+                        kern_lookup_builder.class_pair_count,
+                        kern_lookup_builder.trimmed_pair_count,
+                    )
+                )
+            if mark_lookup_builder:
+                for feature_tag, lookups in mark_lookup_builder.build(self.font).items():
+                    mark_lookup_builder.add_to_font(
+                        self.font,
+                        feature_tag,
+                        lookups,
+                        script_tags = self.project.family.script.tags,
+                    )
+                dirty = True
+                print("[MARK LOOKUPS BUILT] {} lookups".format(mark_lookup_builder.lookup_count))
             if hasattr(self, "postprocess"):
                 self.font = self.postprocess()
                 dirty = True
             if dirty:
                 self.font.save(self.get_path(), reorderTables=False)
                 print("[FONT POSTPROCESSED]", self.get_path())
-
-        if self.built:
-
-            self.copy_out_of_temp()
-
-            output_dir = self.project.directories["output"]
-            if os.path.isdir(output_dir):
-                kit.copy(
-                    self.get_path(),
-                    os.path.join(output_dir, self.filename_with_extension),
-                )
-                print("[COPIED TO OUPUT DIRECTORY]", self.get_path())
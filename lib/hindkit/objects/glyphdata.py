@@ -1,6 +1,12 @@
 import os, sys, collections
 import hindkit as kit
 
+GoadbRecord = collections.namedtuple(
+    "GoadbRecord",
+    ["production_name", "development_name", "uni", "position"],
+)
+
+
 class GlyphData(object):
 
     ITFDG = []
@@ -9,6 +15,20 @@ class GlyphData(object):
     def split(line):
         return line.partition("#")[0].split()
 
+    @staticmethod
+    def parse_uni(uni):
+        """
+        :param uni: The third GOADB column, e.g. "uni0915", "u1F600" or "uni0915,uni0916".
+        :return: List of Unicode scalar values.
+        """
+        u_scalars = []
+        for i in uni.split(","):
+            if i.startswith("uni"):
+                u_scalars.append(int(i[3:], 16))
+            elif i.startswith("u"):
+                u_scalars.append(int(i[1:], 16))
+        return u_scalars
+
     def __init__(
         self,
         glyph_order_name = "glyphorder.txt",
@@ -18,6 +38,11 @@ class GlyphData(object):
         self.dictionary = collections.OrderedDict()
         self.goadb_path = kit.Project.directories["GOADB"]
 
+        self.by_development_name = collections.OrderedDict()
+        self.by_production_name = {}
+        self.by_u_scalar = {}
+        self._style_to_names = {}
+
         if os.path.exists(self.goadb_path):
 
             with open(self.goadb_path) as f:
@@ -32,30 +57,67 @@ class GlyphData(object):
                             uni = None
                         self.dictionary[development_name] = production_name, uni
 
+            for position, (development_name, (production_name, uni)) in enumerate(self.dictionary.items()):
+                record = GoadbRecord(production_name, development_name, uni, position)
+                self.by_development_name[development_name] = record
+                self.by_production_name.setdefault(production_name, record)
+                if uni:
+                    for u_scalar in self.parse_uni(uni):
+                        self.by_u_scalar.setdefault(u_scalar, record)
+
             self.glyph_order = list(self.dictionary.keys())
 
+    def get_position(self, development_name):
+        """:return: Position in the glyph order, or None if not covered by the GOADB."""
+        record = self.by_development_name.get(development_name)
+        return record and record.position
+
+    def get_names_for_style(self, style):
+        """
+        Development names of the glyphs in `style` covered by the GOADB, in glyph order. The result is kept per style, as products of the same style (OTF and TTF) share it.
+        """
+        names = self._style_to_names.get(style.name)
+        if names is None:
+            glyph_names = set(style.open().keys())
+            not_covered_glyphs = sorted(
+                i for i in glyph_names if i not in self.by_development_name
+            )
+            if not_covered_glyphs:
+                print(
+                    "[WARNING] Some glyphs are not covered by the GOADB: " +
+                    " ".join(not_covered_glyphs)
+                )
+                if style.family.project.options["build_ttf"]:
+                    raise SystemExit("[EXIT] GOADB must match the glyph set exactly for compiling TTFs.")
+            names = [i for i in self.glyph_order if i in glyph_names]
+            self._style_to_names[style.name] = names
+        return names
+
     def generate_goadb(self, names=None):
         if names is None:
-            names = self.glyph_order
+            records = self.by_development_name.values()
+        else:
+            records = sorted(
+                (self.by_development_name[i] for i in set(names) if i in self.by_development_name),
+                key = lambda record: record.position,
+            )
         lines = []
-        for development_name, data in list(self.dictionary.items()):
-            if (names is None) or (development_name in names):
-                production_name, uni = data
-                if uni:
-                    lines.append(
-                        "{} {} {}".format(
-                            production_name.replace("-", "__"),
-                            development_name,
-                            uni,
-                        )
+        for record in records:
+            if record.uni:
+                lines.append(
+                    "{} {} {}".format(
+                        record.production_name.replace("-", "__"),
+                        record.development_name,
+                        record.uni,
                     )
-                else:
-                    lines.append(
-                        "{} {}".format(
-                            production_name.replace("-", "__"),
-                            development_name,
-                        )
+                )
+            else:
+                lines.append(
+                    "{} {}".format(
+                        record.production_name.replace("-", "__"),
+                        record.development_name,
                     )
+                )
         return lines
 
 
@@ -84,28 +146,18 @@ class Goadb(kit.BaseFile):
         self.product = product
 
         if self.product:
-            names = self.project.glyph_data.glyph_order
-            reference_font = self.product.style.open()
-            not_covered_glyphs = [
-                glyph.name
-                for glyph in reference_font
-                if glyph.name not in names
-            ]
-            if not_covered_glyphs:
-                print(
-                    "[WARNING] Some glyphs are not covered by the GOADB: " +
-                    " ".join(not_covered_glyphs)
-                )
-                if self.project.options["build_ttf"]:
-                    raise SystemExit("[EXIT] GOADB must match the glyph set exactly for compiling TTFs.")
-            self.names = [
-                name
-                for name in names
-                if name in reference_font
-            ]
+            self.names = self.project.glyph_data.get_names_for_style(self.product.style)
         else:
             self.names = None
 
+    def get_renaming_map(self):
+        """:return: Mapping of the development names to the production names makeotf gives the glyphs."""
+        by_development_name = self.project.glyph_data.by_development_name
+        return {
+            i: by_development_name[i].production_name.replace("-", "__")
+            for i in self.names if i in by_development_name
+        }
+
     def generate(self):
         goadb_lines = self.project.glyph_data.generate_goadb(names=self.names)
         with open(self.get_path(), "w") as f:
@@ -0,0 +1,466 @@
+import collections
+import copy
+
+import fontTools.otlLib.builder as otl
+import fontTools.ttLib
+from fontTools.ttLib.tables import otTables
+
+import WriteFeaturesKernFDK, WriteFeaturesMarkFDK
+
+import hindkit as kit
+
+
+class BaseLookupBuilder(object):
+    """
+    Builds GPOS lookups straight from a UFO, for adding to the font compiled by makeotf instead of writing FEA for makeotf to parse.
+    :param rename: Mapping of development names to the names in the compiled font.
+    """
+
+    LOOKUP_FLAG_RIGHT_TO_LEFT = 0x0001
+    LOOKUP_FLAG_IGNORE_MARKS = 0x0008
+
+    def __init__(self, rename=None):
+        self.rename = kit.fallback(rename, {})
+
+    def get_glyph_name(self, name):
+        return self.rename.get(name, name)
+
+    @staticmethod
+    def add_to_font(tt_font, feature_tag, lookups, script_tags=()):
+        """
+        Append `lookups` to the GPOS of `tt_font`, under `feature_tag` for every script and language system. The GPOS is created if missing, with the scripts of the GSUB, or else DFLT and `script_tags` as in FeatureLanguagesystems.
+        """
+
+        if not lookups:
+            return
+
+        if "GPOS" not in tt_font:
+            gpos = tt_font["GPOS"] = fontTools.ttLib.newTable("GPOS")
+            gpos.table = otTables.GPOS()
+            gpos.table.Version = 0x00010000
+            if "GSUB" in tt_font and tt_font["GSUB"].table.ScriptList:
+                gpos.table.ScriptList = copy.deepcopy(tt_font["GSUB"].table.ScriptList)
+                for lang_sys in BaseLookupBuilder.get_lang_syses(gpos.table):
+                    lang_sys.ReqFeatureIndex = 0xFFFF
+                    lang_sys.FeatureIndex = []
+                    lang_sys.FeatureCount = 0
+            else:
+                gpos.table.ScriptList = otTables.ScriptList()
+                gpos.table.ScriptList.ScriptRecord = []
+                for script_tag in ["DFLT"] + sorted(script_tags):
+                    lang_sys = otTables.DefaultLangSys()
+                    lang_sys.LookupOrder = None
+                    lang_sys.ReqFeatureIndex = 0xFFFF
+                    lang_sys.FeatureIndex = []
+                    lang_sys.FeatureCount = 0
+                    script = otTables.Script()
+                    script.DefaultLangSys = lang_sys
+                    script.LangSysRecord = []
+                    script.LangSysCount = 0
+                    script_record = otTables.ScriptRecord()
+                    script_record.ScriptTag = script_tag
+                    script_record.Script = script
+                    gpos.table.ScriptList.ScriptRecord.append(script_record)
+                gpos.table.ScriptList.ScriptCount = len(gpos.table.ScriptList.ScriptRecord)
+            gpos.table.FeatureList = otTables.FeatureList()
+            gpos.table.FeatureList.FeatureRecord = []
+            gpos.table.FeatureList.FeatureCount = 0
+            gpos.table.LookupList = otTables.LookupList()
+            gpos.table.LookupList.Lookup = []
+            gpos.table.LookupList.LookupCount = 0
+
+        table = tt_font["GPOS"].table
+        lookup_list = table.LookupList
+        start = len(lookup_list.Lookup)
+        lookup_list.Lookup.extend(lookups)
+        lookup_list.LookupCount = len(lookup_list.Lookup)
+        lookup_indices = list(range(start, len(lookup_list.Lookup)))
+
+        feature_records = table.FeatureList.FeatureRecord
+        existing = [i for i in feature_records if i.FeatureTag == feature_tag]
+        if existing:
+            for feature_record in existing:
+                feature = feature_record.Feature
+                feature.LookupListIndex.extend(lookup_indices)
+                feature.LookupCount = len(feature.LookupListIndex)
+            return
+
+        feature = otTables.Feature()
+        feature.FeatureParams = None
+        feature.LookupListIndex = lookup_indices
+        feature.LookupCount = len(lookup_indices)
+        feature_record = otTables.FeatureRecord()
+        feature_record.FeatureTag = feature_tag
+        feature_record.Feature = feature
+
+        # Feature records are sorted by tag:
+        position = len([i for i in feature_records if i.FeatureTag <= feature_tag])
+        feature_records.insert(position, feature_record)
+        table.FeatureList.FeatureCount = len(feature_records)
+
+        for lang_sys in BaseLookupBuilder.get_lang_syses(table):
+            feature_indices = [i + 1 if i >= position else i for i in lang_sys.FeatureIndex]
+            feature_indices.append(position)
+            lang_sys.FeatureIndex = sorted(feature_indices)
+            lang_sys.FeatureCount = len(lang_sys.FeatureIndex)
+            if lang_sys.ReqFeatureIndex != 0xFFFF and lang_sys.ReqFeatureIndex >= position:
+                lang_sys.ReqFeatureIndex += 1
+
+    @staticmethod
+    def get_lang_syses(table):
+        for script_record in table.ScriptList.ScriptRecord:
+            script = script_record.Script
+            if script.DefaultLangSys:
+                yield script.DefaultLangSys
+            for lang_sys_record in script.LangSysRecord:
+                yield lang_sys_record.LangSys
+
+
+class KernLookupBuilder(BaseLookupBuilder):
+    """
+    Builds the kern lookups of WriteFeaturesKernFDK from UFO kerning and groups, without the kern.fea round trip.
+
+    Pairs are resolved as in UFO 3: glyph-glyph over glyph-group over group-glyph over group-group. Every pair with a glyph on either side is enumerated into format 1 subtables, which come first; group-group pairs go into format 2 subtables, a new one wherever groups would overlap. Pairs that only restate what the group-group subtables give are dropped, and so are ones under `min_kern` that override nothing. Pairs involving groups tagged as Arabic or Hebrew make a separate right-to-left lookup.
+    """
+
+    def __init__(self, kerning, groups, min_kern=WriteFeaturesKernFDK.kDefaultMinKern, rename=None):
+        super().__init__(rename=rename)
+        self.kerning = dict(kerning)
+        self.groups = {k: list(v) for k, v in groups.items()}
+        self.min_kern = min_kern
+        self.glyph_pair_count = 0
+        self.class_pair_count = 0
+        self.trimmed_pair_count = 0
+
+    def is_group(self, name):
+        return name in self.groups
+
+    @staticmethod
+    def is_rtl(pair):
+        return any(
+            tag in side
+            for tag in [WriteFeaturesKernFDK.kArabicTag, WriteFeaturesKernFDK.kHebrewTag]
+            for side in pair
+        )
+
+    def get_members(self, name, glyph_map):
+        names = self.groups[name] if self.is_group(name) else [name]
+        members = []
+        for glyph_name in names:
+            glyph_name = self.get_glyph_name(glyph_name)
+            if glyph_name in glyph_map:
+                members.append(glyph_name)
+        return members
+
+    def build(self, glyph_map):
+        """
+        :param glyph_map: Mapping of the glyph names in the compiled font to glyph IDs, from `TTFont.getReverseGlyphMap()`.
+        :return: List of lookups, the right-to-left one last.
+        """
+
+        ltr_kerning, rtl_kerning = {}, {}
+        for (left, right), value in sorted(self.kerning.items()):
+            if WriteFeaturesKernFDK.kIgnorePairTag in left:
+                continue
+            if self.is_rtl((left, right)):
+                rtl_kerning[left, right] = value
+            else:
+                ltr_kerning[left, right] = value
+
+        min_kern = self.min_kern
+        if not any(self.is_group(i) for pair in self.kerning for i in pair):
+            # As in WriteFeaturesKernFDK, there are no exceptions to tell apart from small values.
+            min_kern = 0
+
+        lookups = []
+        for kerning, flags in [
+            (ltr_kerning, 0),
+            (rtl_kerning, self.LOOKUP_FLAG_RIGHT_TO_LEFT | self.LOOKUP_FLAG_IGNORE_MARKS),
+        ]:
+            subtables = self._build_subtables(kerning, glyph_map, min_kern, is_rtl=bool(flags))
+            if subtables:
+                lookups.append(otl.buildLookup(subtables, flags=flags))
+        return lookups
+
+    @staticmethod
+    def get_value(value, is_rtl):
+        if is_rtl:
+            return otl.buildValue({"XPlacement": value, "XAdvance": value})
+        return otl.buildValue({"XAdvance": value})
+
+    def _build_subtables(self, kerning, glyph_map, min_kern, is_rtl):
+
+        # Predefined exceptions, glyph-glyph, glyph-group, group-glyph, group-group:
+        levels = [[], [], [], [], []]
+        for (left, right), value in kerning.items():
+            if WriteFeaturesKernFDK.kExceptionTag in left or WriteFeaturesKernFDK.kExceptionTag in right:
+                level = 0
+            elif not self.is_group(left):
+                level = 2 if self.is_group(right) else 1
+            else:
+                level = 4 if self.is_group(right) else 3
+            levels[level].append(((left, right), value))
+
+        class_subtables = self._split_class_pairs(levels[4], glyph_map, min_kern)
+        left_glyph_to_subtable = {}
+        for subtable in class_subtables:
+            for glyph_name in subtable["left"]:
+                left_glyph_to_subtable.setdefault(glyph_name, subtable)
+
+        def get_class_value(left, right):
+            subtable = left_glyph_to_subtable.get(left)
+            if subtable is None:
+                return 0
+            return subtable["values"].get((subtable["left"][left], subtable["right"].get(right)), 0)
+
+        glyph_pairs = collections.OrderedDict()
+        for level in levels[:4]:
+            for (left, right), value in level:
+                for left_glyph in self.get_members(left, glyph_map):
+                    for right_glyph in self.get_members(right, glyph_map):
+                        glyph_pairs.setdefault((left_glyph, right_glyph), value)
+
+        glyph_pair_values = {}
+        for (left, right), value in glyph_pairs.items():
+            class_value = get_class_value(left, right)
+            if value == class_value or (abs(value) < min_kern and class_value == 0):
+                self.trimmed_pair_count += 1
+                continue
+            glyph_pair_values[left, right] = (self.get_value(value, is_rtl), None)
+        self.glyph_pair_count += len(glyph_pair_values)
+
+        subtables = []
+        if glyph_pair_values:
+            subtables.extend(otl.buildPairPosGlyphs(glyph_pair_values, glyph_map))
+        for subtable in class_subtables:
+            self.class_pair_count += len(subtable["values"])
+            subtables.append(otl.buildPairPosClassesSubtable(
+                {k: (self.get_value(v, is_rtl), None) for k, v in subtable["values"].items()},
+                glyph_map,
+            ))
+        return subtables
+
+    def _split_class_pairs(self, pairs, glyph_map, min_kern):
+        """
+        Group-group pairs, by left group, into the first subtable where neither side overlaps a different group. A glyph is only kerned by the first subtable covering it on the left.
+        :return: List of dictionaries, holding the group of each glyph on each side and the values of group pairs.
+        """
+
+        left_to_pairs = collections.OrderedDict()
+        for (left, right), value in pairs:
+            if abs(value) < max(min_kern, 1):
+                self.trimmed_pair_count += 1
+                continue
+            left_class = tuple(sorted(self.get_members(left, glyph_map)))
+            right_class = tuple(sorted(self.get_members(right, glyph_map)))
+            if left_class and right_class:
+                left_to_pairs.setdefault(left_class, []).append((right_class, value))
+
+        def can_add(glyph_to_class, classes):
+            glyph_to_class_new = {}
+            for class_ in classes:
+                for glyph_name in class_:
+                    existing = glyph_to_class.get(glyph_name, glyph_to_class_new.get(glyph_name))
+                    if existing is not None and existing != class_:
+                        return False
+                    glyph_to_class_new[glyph_name] = class_
+            return True
+
+        subtables = []
+        for left_class, right_values in left_to_pairs.items():
+            right_classes = [i for i, _ in right_values]
+            for subtable in subtables:
+                if can_add(subtable["left"], [left_class]) and can_add(subtable["right"], right_classes):
+                    break
+            else:
+                subtable = {"left": {}, "right": {}, "values": collections.OrderedDict()}
+                subtables.append(subtable)
+            for glyph_name in left_class:
+                subtable["left"][glyph_name] = left_class
+            for right_class, value in right_values:
+                if not can_add(subtable["right"], [right_class]):
+                    print("[WARNING] Kerning class overlaps another on the right side, skipping:", right_class)
+                    continue
+                for glyph_name in right_class:
+                    subtable["right"][glyph_name] = right_class
+                subtable["values"][left_class, right_class] = value
+        return subtables
+
+
+class MarkLookupBuilder(BaseLookupBuilder):
+    """
+    Builds the lookups of WriteFeaturesMarkFDK from UFO anchors without the FEA round trip: MarkBasePos and MarkLigPos lookups for each mark type, and MarkMarkPos ones for mark-to-mark positioning. With `indic`, the lookups of abvm and blwm anchors go to those features instead of mark and mkmk, as the FEA files are split. MarkAttachmentType is expressed as a mark filtering set.
+    :param base_overrides: Mapping of mark types to mappings of base glyph names to (glyph names, x offset). The anchor of such a base is given to those glyphs instead, moved by the offset. Bases mapped to no glyphs are dropped.
+    """
+
+    FEATURE_TAGS = ["mark", "mkmk", "abvm", "blwm"]
+
+    def __init__(self, font, mkmk=True, indic=False, base_overrides=None, rename=None):
+        super().__init__(rename=rename)
+        self.indic = indic
+        self.base_overrides = kit.fallback(base_overrides, {})
+        self.data = WriteFeaturesMarkFDK.MarkDataClass(
+            font = font,
+            folderPath = None,
+            trimCasingTags = False,
+            genMkmkFeature = mkmk,
+            writeClassesFile = False,
+            indianScriptsFormat = indic,
+            writeFiles = False,
+        )
+        self.lookup_count = 0
+
+    def get_feature_tag(self, name, default):
+        if self.indic:
+            if WriteFeaturesMarkFDK.kIndianAboveMarks in name:
+                return "abvm"
+            if WriteFeaturesMarkFDK.kIndianBelowMarks in name:
+                return "blwm"
+        return default
+
+    @staticmethod
+    def is_rtl(name):
+        return name[-3:] in WriteFeaturesMarkFDK.kRTLtagsList
+
+    def get_marks(self, glyph_map):
+        """:return: Mapping of mark types to mappings of mark glyph names to (0, anchor)."""
+        type_to_marks = {}
+        for anchor in sorted(self.data.anchorsDataInCombMarksDict, key=WriteFeaturesMarkFDK.sortKey):
+            if WriteFeaturesMarkFDK.kIgnoreAnchorTag in anchor.name:
+                continue
+            marks = type_to_marks.setdefault(anchor.name[1:], {})
+            for glyph_name in self.data.anchorsDataInCombMarksDict[anchor]:
+                glyph_name = self.get_glyph_name(glyph_name)
+                if glyph_name in glyph_map:
+                    marks.setdefault(glyph_name, (0, otl.buildAnchor(anchor.x, anchor.y)))
+        return type_to_marks
+
+    def get_bases(self, mark_type, glyph_map):
+        overrides = self.base_overrides.get(mark_type, {})
+        bases = {}
+        for anchor in self.data.baseAnchorsByMarkType.get(mark_type, []):
+            for glyph_name in self.data.anchorsDataInBaseGlyphsDict[anchor]:
+                if glyph_name in overrides:
+                    glyph_names, x_offset = overrides[glyph_name]
+                else:
+                    glyph_names, x_offset = [glyph_name], 0
+                for glyph_name in glyph_names:
+                    glyph_name = self.get_glyph_name(glyph_name)
+                    if glyph_name in glyph_map:
+                        bases.setdefault(glyph_name, {0: otl.buildAnchor(anchor.x + x_offset, anchor.y)})
+        return bases
+
+    def get_ligatures(self, mark_type, glyph_map):
+        ligatures = {}
+        for record in self.data.ligatureAnchorsByMarkType.get(mark_type, []):
+            if record.elementCount != len(record.components):
+                print("[WARNING] Number of components in ligature {} does not match the number of anchors of the type {}.".format(record.glyphName, mark_type))
+                continue
+            glyph_name = self.get_glyph_name(record.glyphName)
+            if glyph_name in glyph_map:
+                ligatures[glyph_name] = [
+                    {0: otl.buildAnchor(i.x, i.y)}
+                    for i in sorted(record.components, key=WriteFeaturesMarkFDK.sortKey)
+                ]
+        return ligatures
+
+    def get_mark2s(self, mark_type, glyph_map):
+        mark2s = {}
+        for record in sorted(self.data.anchorsDataInCombMkmksDict[mark_type], key=WriteFeaturesMarkFDK.sortKey):
+            glyph_name = self.get_glyph_name(record.glyphName)
+            if glyph_name in glyph_map:
+                mark2s.setdefault(glyph_name, {0: otl.buildAnchor(record.x, record.y)})
+        return mark2s
+
+    @staticmethod
+    def build_mark_mark_subtable(marks, mark2s, glyph_map):
+        """MarkMarkPos has the structure of MarkBasePos, under other names."""
+        mark_base = otl.buildMarkBasePosSubtable(marks, mark2s, glyph_map)
+        subtable = otTables.MarkMarkPos()
+        subtable.Format = 1
+        subtable.Mark1Coverage = mark_base.MarkCoverage
+        subtable.Mark1Array = mark_base.MarkArray
+        subtable.ClassCount = mark_base.ClassCount
+        subtable.Mark2Coverage = mark_base.BaseCoverage
+        subtable.Mark2Array = otTables.Mark2Array()
+        subtable.Mark2Array.Mark2Record = []
+        for base_record in mark_base.BaseArray.BaseRecord:
+            mark2_record = otTables.Mark2Record()
+            mark2_record.Mark2Anchor = base_record.BaseAnchor
+            subtable.Mark2Array.Mark2Record.append(mark2_record)
+        subtable.Mark2Array.Mark2Count = len(subtable.Mark2Array.Mark2Record)
+        return subtable
+
+    @staticmethod
+    def add_mark_filtering_set(tt_font, glyph_names):
+        """:return: Index of a new mark filtering set in the GDEF of `tt_font`, or None if there is no GDEF."""
+        if "GDEF" not in tt_font:
+            return None
+        gdef = tt_font["GDEF"].table
+        glyph_map = tt_font.getReverseGlyphMap()
+        if getattr(gdef, "MarkGlyphSetsDef", None) is None:
+            gdef.Version = 0x00010002
+            gdef.MarkGlyphSetsDef = otl.buildMarkGlyphSetsDef([glyph_names], glyph_map)
+        else:
+            mark_glyph_sets = gdef.MarkGlyphSetsDef
+            mark_glyph_sets.Coverage.append(otl.buildCoverage(glyph_names, glyph_map))
+            mark_glyph_sets.MarkSetCount = len(mark_glyph_sets.Coverage)
+        return gdef.MarkGlyphSetsDef.MarkSetCount - 1
+
+    def build(self, tt_font):
+        """
+        :param tt_font: The compiled font, whose GDEF gets the mark filtering sets.
+        :return: Mapping of feature tags to lists of lookups, in the order of FEATURE_TAGS.
+        """
+
+        glyph_map = tt_font.getReverseGlyphMap()
+        type_to_marks = self.get_marks(glyph_map)
+        tag_to_lookups = collections.OrderedDict((i, []) for i in self.FEATURE_TAGS)
+
+        def add(tag, subtable, flags=0, mark_filtering_set=None):
+            tag_to_lookups[tag].append(otl.buildLookup([subtable], flags=flags, markFilterSet=mark_filtering_set))
+            self.lookup_count += 1
+
+        for mark_type in self.data.markTypesList:
+            marks = type_to_marks.get(mark_type)
+            bases = self.get_bases(mark_type, glyph_map)
+            if marks and bases:
+                add(
+                    self.get_feature_tag(mark_type, "mark"),
+                    otl.buildMarkBasePosSubtable(marks, bases, glyph_map),
+                    flags = self.LOOKUP_FLAG_RIGHT_TO_LEFT if self.is_rtl(mark_type) else 0,
+                )
+            elif not bases:
+                print("[WARNING] The anchor {} is not used in any of the base glyphs.".format(mark_type))
+
+        for mark_type in self.data.markTypesList:
+            marks = type_to_marks.get(mark_type)
+            ligatures = self.get_ligatures(mark_type, glyph_map)
+            if marks and ligatures:
+                add(
+                    self.get_feature_tag(mark_type, "mark"),
+                    otl.buildMarkLigPosSubtable(marks, ligatures, glyph_map),
+                    flags = self.LOOKUP_FLAG_RIGHT_TO_LEFT if self.is_rtl(mark_type) else 0,
+                )
+
+        for mark_type in sorted(self.data.anchorsDataInCombMkmksDict):
+            marks = type_to_marks.get(mark_type)
+            mark2s = self.get_mark2s(mark_type, glyph_map)
+            if not marks or not mark2s:
+                continue
+            tag = self.get_feature_tag(mark_type, "mkmk")
+            flags = 0
+            mark_filtering_set = None
+            # As in WriteFeaturesMarkFDK, abvm and blwm lookups have no lookup flags:
+            if tag == "mkmk":
+                if self.is_rtl(mark_type):
+                    flags = self.LOOKUP_FLAG_RIGHT_TO_LEFT
+                mark_filtering_set = self.add_mark_filtering_set(tt_font, marks)
+            add(
+                tag,
+                self.build_mark_mark_subtable(marks, mark2s, glyph_map),
+                flags = flags,
+                mark_filtering_set = mark_filtering_set,
+            )
+
+        return tag_to_lookups
@@ -0,0 +1,193 @@
+import contextlib
+import datetime
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import hindkit as kit
+
+
+def get_peak_rss(children=False):
+    """In bytes."""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(
+        resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    ).ru_maxrss
+    if sys.platform == "darwin":
+        return peak_rss
+    return peak_rss * 1024
+
+def get_children_cpu_time():
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def get_process_cpu_time():
+    """Of all threads of the process, plus its children waited for so far (subprocesses and forked workers)."""
+    if resource is None:
+        return time.process_time()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime + get_children_cpu_time()
+
+def get_size(paths):
+    size = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for root, directory_names, filenames in os.walk(path):
+                size += sum(os.path.getsize(os.path.join(root, i)) for i in filenames)
+        elif os.path.isfile(path):
+            size += os.path.getsize(path)
+    return size
+
+
+class Instrumentation(object):
+    """
+    Records wall time, CPU time, peak RSS and bytes written for the build, its stages, its tasks and the subprocesses they call, and writes them as a JSON report.
+
+    CPU time of a task is the time of its own thread, plus the time of the subprocesses it waited for. CPU time of the build is the time of the whole process and its children, whichever threads or workers the tasks ran in. Peak RSS is the peak of the whole build process (or of the largest subprocess waited for so far) when the record ends, as the platforms don't report it per thread.
+
+    Bytes written are the sizes of the outputs declared for a record, or else the sum of those of the subprocesses it waited for. For the build, they are the sum of those of its tasks and of the subprocesses it called outside tasks.
+    """
+
+    thread_time = getattr(time, "thread_time", time.process_time)
+
+    def __init__(self, project):
+        self.project = project
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_parent(self):
+        stack = getattr(self._local, "stack", None)
+        return stack[-1]["name"] if stack else None
+
+    @contextlib.contextmanager
+    def measure(self, name, kind="task", stage=None, outputs=None):
+        """:param outputs: Paths the measured work writes, or a callable returning them once it has finished."""
+
+        record = {
+            "name": name,
+            "kind": kind,
+            "stage": stage,
+            "parent": self._get_parent(),
+            "started": time.time(),
+        }
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        self._local.stack.append(record)
+        record["bytes_written"] = 0
+        with self._lock:
+            record_count = len(self.records)
+
+        wall_time_start = time.perf_counter()
+        cpu_time_start = self.thread_time()
+        children_cpu_time_start = get_children_cpu_time()
+        process_cpu_time_start = get_process_cpu_time()
+
+        try:
+            yield record
+        finally:
+            self._local.stack.pop()
+            record["wall_time"] = time.perf_counter() - wall_time_start
+            if callable(outputs):
+                outputs = outputs()
+            children_cpu_time = get_children_cpu_time() - children_cpu_time_start
+            if kind == "subprocess":
+                record["cpu_time"] = children_cpu_time
+                record["peak_rss"] = get_peak_rss(children=True)
+                record["bytes_written"] = get_size(kit.fallback(outputs, []))
+                # Subprocesses don't show up in the I/O counters of the waiting thread:
+                for parent in self._local.stack:
+                    parent["bytes_written"] += record["bytes_written"]
+            elif kind == "build":
+                record["cpu_time"] = get_process_cpu_time() - process_cpu_time_start
+                record["peak_rss"] = get_peak_rss()
+                # Records made in the build thread have it as their parent, those made in pool threads have none:
+                with self._lock:
+                    record["bytes_written"] = sum(
+                        i["bytes_written"] or 0
+                        for i in self.records[record_count:]
+                        if i["parent"] in (None, name)
+                    )
+            else:
+                record["cpu_time"] = self.thread_time() - cpu_time_start + children_cpu_time
+                record["peak_rss"] = get_peak_rss()
+                if outputs is not None:
+                    record["bytes_written"] = get_size(outputs)
+            with self._lock:
+                self.records.append(record)
+
+    def add_records(self, records):
+        """Add records made elsewhere, e.g. in a worker process."""
+        with self._lock:
+            self.records.extend(records)
+
+    def call(self, arguments, outputs=None):
+        """`subprocess.call`, measured. `outputs` are the paths the subprocess writes."""
+        with self.measure(arguments[0], kind="subprocess", stage=None, outputs=outputs):
+            return subprocess.call(arguments)
+
+    def get_stage_records(self):
+        stages = {}
+        for record in self.records:
+            if record["kind"] != "task" or not record["stage"]:
+                continue
+            stage = stages.setdefault(record["stage"], {
+                "name": record["stage"],
+                "kind": "stage",
+                "started": record["started"],
+                "ended": record["started"],
+                "cpu_time": 0,
+                "peak_rss": None,
+                "bytes_written": 0,
+                "tasks": 0,
+            })
+            stage["started"] = min(stage["started"], record["started"])
+            stage["ended"] = max(stage["ended"], record["started"] + record["wall_time"])
+            stage["cpu_time"] += record["cpu_time"]
+            stage["peak_rss"] = max(stage["peak_rss"] or 0, record["peak_rss"] or 0) or None
+            stage["bytes_written"] += record["bytes_written"] or 0
+            stage["tasks"] += 1
+        for stage in stages.values():
+            stage["wall_time"] = stage.pop("ended") - stage["started"]
+        return sorted(stages.values(), key=lambda i: i["started"])
+
+    def get_path(self):
+        return os.path.join(self.project.directories["products"], "build_report.json")
+
+    def write_report(self):
+        report = {
+            "family": self.project.family.name,
+            "fontrevision": self.project.fontrevision,
+            "version_string": self.project.version_string,
+            "date": datetime.datetime.now().isoformat(),
+            "test": self.project.args.test,
+            "max_workers": self.project.options["max_workers"],
+            "tool_versions": kit.BuildCache.get_tool_versions(),
+            "build": [i for i in self.records if i["kind"] == "build"],
+            "stages": self.get_stage_records(),
+            "tasks": [i for i in self.records if i["kind"] == "task"],
+            "subprocesses": [i for i in self.records if i["kind"] == "subprocess"],
+            "products": [
+                {
+                    "path": i.get_path(temp=False),
+                    "built": i.built,
+                    "size": get_size([i.get_path(temp=False)]),
+                }
+                for i in self.project.products
+            ],
+        }
+        kit.makedirs(os.path.dirname(self.get_path()))
+        with open(self.get_path(), "w") as f:
+            json.dump(report, f, indent=2, default=repr)
+        print("[BUILD REPORT]", self.get_path())
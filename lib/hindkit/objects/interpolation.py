@@ -0,0 +1,203 @@
+import defcon
+import fontMath
+import mutatorMath.objects.mutator
+import numpy
+
+import hindkit as kit
+
+
+class Interpolator(object):
+    """
+    Interpolates all styles of a family at once. The geometry of every glyph whose structure matches across masters is packed into one master matrix, so each style is a row of `weights @ matrix`. Other glyphs fall back to mutatorMath one by one.
+
+    Like `makeInstancesUFO -a -c -n`, lib, groups and non-numeric info come from the first master, and geometry is rounded.
+    """
+
+    def __init__(self, family):
+        self.family = family
+        self.project = family.project
+        self.fonts = [i.open() for i in family.masters]
+        self.locations = [kit.DesignSpace.get_location(i.location) for i in family.masters]
+        glyph_names = {}
+        for font in self.fonts:
+            glyph_names.update(dict.fromkeys(font.keys()))
+        self.glyph_names = list(glyph_names)
+        self._pack()
+
+    @staticmethod
+    def get_structure(glyph):
+        return (
+            tuple(tuple(point.segmentType for point in contour) for contour in glyph),
+            tuple(component.baseGlyph for component in glyph.components),
+            tuple(anchor.name for anchor in glyph.anchors),
+        )
+
+    @staticmethod
+    def get_vector(glyph):
+        """Width, height, points, component transformations and anchors, flattened."""
+        vector = [glyph.width, glyph.height]
+        for contour in glyph:
+            for point in contour:
+                vector.extend((point.x, point.y))
+        for component in glyph.components:
+            vector.extend(component.transformation)
+        for anchor in glyph.anchors:
+            vector.extend((anchor.x, anchor.y))
+        return vector
+
+    def _pack(self):
+
+        self.glyph_to_slice = {}
+        self.fallback_glyph_names = []
+        vectors = [[] for _ in self.fonts]
+        is_rounded = []
+
+        for glyph_name in self.glyph_names:
+            if not all(glyph_name in font for font in self.fonts):
+                self.fallback_glyph_names.append(glyph_name)
+                continue
+            glyphs = [font[glyph_name] for font in self.fonts]
+            structure = self.get_structure(glyphs[0])
+            if any(self.get_structure(glyph) != structure for glyph in glyphs[1:]):
+                self.fallback_glyph_names.append(glyph_name)
+                continue
+            start = len(is_rounded)
+            for vector, glyph in zip(vectors, glyphs):
+                vector.extend(self.get_vector(glyph))
+            point_count = sum(len(i) for i in structure[0])
+            is_rounded.extend([True] * (2 + point_count * 2))
+            for _ in structure[1]:
+                # Scales are not rounded, offsets are:
+                is_rounded.extend([False, False, False, False, True, True])
+            is_rounded.extend([True] * len(structure[2]) * 2)
+            self.glyph_to_slice[glyph_name] = slice(start, len(is_rounded))
+
+        self.matrix = numpy.array(vectors, dtype=numpy.float64)
+        self.is_rounded = numpy.array(is_rounded, dtype=bool)
+
+    @staticmethod
+    def round(array):
+        """Half up, as otRound."""
+        return numpy.floor(array + 0.5)
+
+    def to_values(self, result):
+        """:return: The packed glyph vector of a style as a list, with rounded values as ints, so they are written as such in the UFO and features."""
+        return [
+            int(value) if is_rounded else value
+            for value, is_rounded in zip(result.tolist(), self.is_rounded.tolist())
+        ]
+
+    def interpolate(self, styles):
+        """:return: Matrix of the packed glyph vectors, one row per style."""
+        weights = numpy.array(
+            [self.family.get_master_weights(i.location) for i in styles],
+            dtype = numpy.float64,
+        )
+        result = weights @ self.matrix
+        result[:, self.is_rounded] = self.round(result[:, self.is_rounded])
+        return result
+
+    def generate(self, styles):
+
+        results = self.interpolate(styles)
+        print(
+            "[INTERPOLATED] {} glyphs for {} styles, {} glyphs one by one".format(
+                len(self.glyph_to_slice), len(styles), len(self.fallback_glyph_names),
+            )
+        )
+
+        for style, result in zip(styles, results):
+
+            values = self.to_values(result)
+
+            location = kit.DesignSpace.get_location(style.location)
+            source = self.fonts[0]
+            font = defcon.Font()
+            font.lib.update(source.lib)
+            font.groups.update(source.groups)
+            font.info.setDataFromSerialization(source.info.getDataForSerialization())
+
+            _, mutator = mutatorMath.objects.mutator.buildMutator([
+                (location_, fontMath.MathInfo(i.info))
+                for location_, i in zip(self.locations, self.fonts)
+            ])
+            mutator.makeInstance(location).round().extractInfo(font.info)
+            font.info.familyName = self.family.name
+            font.info.styleName = style.name
+            font.info.postscriptFontName = style.full_name_postscript
+
+            if self.project.options["prepare_kerning"]:
+                self._interpolate_kerning(font, style)
+
+            for glyph_name in self.glyph_names:
+                if glyph_name in self.glyph_to_slice:
+                    self._extract_glyph(
+                        font.newGlyph(glyph_name),
+                        source[glyph_name],
+                        values[self.glyph_to_slice[glyph_name]],
+                    )
+                else:
+                    self._interpolate_glyph(font, glyph_name, location)
+
+            kit.remove(style.get_path())
+            kit.makedirs(style.get_directory())
+            font.save(style.get_path())
+            if self.project.options["keep_fonts_in_memory"]:
+                style.defconFont = font
+            print("[GENERATED]", style.get_path())
+
+    @staticmethod
+    def _extract_glyph(glyph, source_glyph, vector):
+        values = iter(vector)
+        glyph.width = next(values)
+        glyph.height = next(values)
+        glyph.unicodes = source_glyph.unicodes
+        pen = glyph.getPointPen()
+        for contour in source_glyph:
+            pen.beginPath()
+            for point in contour:
+                pen.addPoint(
+                    (next(values), next(values)),
+                    segmentType = point.segmentType,
+                    smooth = point.smooth,
+                    name = point.name,
+                )
+            pen.endPath()
+        for component in source_glyph.components:
+            pen.addComponent(
+                component.baseGlyph,
+                tuple(next(values) for _ in range(6)),
+            )
+        for anchor in source_glyph.anchors:
+            glyph.appendAnchor({"name": anchor.name, "x": next(values), "y": next(values)})
+        glyph.lib.update(source_glyph.lib)
+
+    def _interpolate_glyph(self, font, glyph_name, location):
+        items = [
+            (location_, fontMath.MathGlyph(i[glyph_name]))
+            for location_, i in zip(self.locations, self.fonts)
+            if glyph_name in i
+        ]
+        try:
+            _, mutator = mutatorMath.objects.mutator.buildMutator(items)
+            math_glyph = mutator.makeInstance(location).round()
+        except Exception as e:
+            print("[WARNING] Problem making glyph {}, skipping: {}".format(glyph_name, e))
+            return
+        glyph = font.newGlyph(glyph_name)
+        math_glyph.extractGlyph(glyph, onlyGeometry=True)
+        source_glyph = next(i[glyph_name] for i in self.fonts if glyph_name in i)
+        glyph.unicodes = source_glyph.unicodes
+        glyph.lib.update(source_glyph.lib)
+
+    def _interpolate_kerning(self, font, style):
+        pairs = {}
+        for master_font in self.fonts:
+            pairs.update(dict.fromkeys(master_font.kerning.keys()))
+        pairs = list(pairs)
+        values = numpy.array(
+            [[i.kerning.find(pair, 0) for pair in pairs] for i in self.fonts],
+            dtype = numpy.float64,
+        )
+        weights = numpy.array(self.family.get_master_weights(style.location), dtype=numpy.float64)
+        font.kerning.update(zip(pairs, self.round(weights @ values).astype(numpy.int64).tolist()))
@@ -1,8 +1,9 @@
 import argparse
 import collections
 import errno
+import functools
+import glob
 import os
-import subprocess
 
 import fontTools.ttLib
 
@@ -25,6 +26,7 @@ class Project(object):
         "GOADB": "GlyphOrderAndAliasDB",
         "features": "features",
         "intermediates": "intermediates",
+        "cache": "cache",
         "products": "products",
         "misc": "misc",
         "output": "/Library/Application Support/Adobe/Fonts",
@@ -92,6 +94,8 @@ class Project(object):
         self.abbrs_of_scripts_to_match_mI_variants = []
         self.script_abbr_current = None
 
+        self._warned_about_kern_postprocessing = False
+
         self.options = {
 
             "prepare_masters": True,
@@ -102,17 +106,28 @@ class Project(object):
             "prepare_kerning": False,
             "prepare_mark_positioning": False,
             "prepare_mark_to_mark_positioning": True,
+            "build_kern_lookups_directly": False,  # Add kern lookups to the compiled font instead of writing kern.fea. Not with `FeatureKern.postprocess`.
+            "min_kern": None,  # Smaller kerning values are trimmed unless they override others. None for the default of WriteFeaturesKernFDK.
+            "build_mark_lookups_directly": False,  # Add mark, mkmk, abvm and blwm lookups to the compiled font instead of writing their FEA.
 
             "match_mI_variants": 0,
             "match_mI_variants_for_scripts": None,
             "position_marks_for_mI_variants": False,
 
             "run_makeinstances": True,
+            "generate_instances_in_process": True,  # Instead of running makeInstancesUFO.
+            "use_numpy_interpolation": False,  # Interpolate all styles at once.
             "do_normalize": True,
             "run_checkoutlines": True,
             "run_autohint": False,
             "build_ttf": False,
 
+            "max_workers": 1,  # None for as many as CPUs.
+            "incremental": False,  # Keep intermediates and skip tasks whose inputs didn't change.
+            "use_build_cache": False,
+            "save_incrementally": False,  # Hard-link unchanged glyphs to the previous version of a UFO.
+            "keep_fonts_in_memory": False,  # Write UFOs only when an external tool reads them.
+
             "override_GDEF": True,
             "override_x_and_cap_heights": False,
 
@@ -137,6 +152,13 @@ class Project(object):
 
         self._finalize_options()
 
+        self.instrumentation = kit.Instrumentation(self)
+
+        if self.options["use_build_cache"]:
+            self.cache = kit.BuildCache(self)
+        else:
+            self.cache = None
+
     def _finalize_options(self):
 
         parser = argparse.ArgumentParser(
@@ -154,6 +176,14 @@ class Project(object):
             "--options", action = "store",
             help = '"0" for none, "1" for "makeinstances", "2" for "checkoutlines", and "3" for "autohint".',
         )
+        parser.add_argument(
+            "--no-cache", action = "store_true",
+            help = "ignore the build cache and rebuild everything.",
+        )
+        parser.add_argument(
+            "--workers", action = "store", type = int,
+            help = "number of build tasks to run in parallel, \"0\" for as many as CPUs.",
+        )
         self.args = parser.parse_args()
 
         if self.args.stages:
@@ -167,6 +197,10 @@ class Project(object):
             self.options["run_makeinstances"] = "1" in options
             self.options["run_checkoutlines"] = "2" in options
             self.options["run_autohint"] = "3" in options
+        if self.args.no_cache:
+            self.options["use_build_cache"] = False
+        if self.args.workers is not None:
+            self.options["max_workers"] = self.args.workers or None
         if self.args.test:
             self.options["run_makeinstances"] = False
             self.options["run_checkoutlines"] = False
@@ -227,82 +261,269 @@ class Project(object):
         kit.remove(path)
         kit.makedirs(path)
 
-    def build(self):
-
-        self.reset_directory("intermediates")
-
+    def prepare_master(self, master):
+        master.prepare()
+        if hasattr(master, "postprocess"):
+            master.postprocess()
+            master.refresh_groups()
+        master.save()
+
+    def prepare_features(self):
+
+        if self.family.styles[0].file_format == "UFO":
+            reference_font = self.products[0].style.open()
+            self.family.info.unitsPerEm = reference_font.info.unitsPerEm
+        elif self.family.styles[0].file_format == "OTF":
+            reference_font = fontTools.ttLib.TTFont(self.products[0].style.get_path())
+            self.family.info.unitsPerEm = reference_font["head"].unitsPerEm
+
+        for feature in self.get_shared_features():
+            feature.prepare()
+
+    def set_up_features(self):
+        """Set up the shared features, which the features of each style refer to even when they are up to date."""
+        self.feature_classes = kit.FeatureClasses(self)
+        self.feature_tables = kit.FeatureTables(self)
+        self.feature_languagesystems = kit.FeatureLanguagesystems(self)
+        self.feature_gsub = kit.FeatureGSUB(self)
+        self.feature_gpos = kit.FeatureGPOS(self)
+
+    def get_shared_features(self):
+        return [
+            self.feature_classes,
+            self.feature_tables,
+            self.feature_languagesystems,
+            self.feature_gsub,
+            self.feature_gpos,
+        ]
+
+    def is_building_kern_lookups_directly(self):
+        """
+        :return: Whether kern lookups go straight into the compiled font. Not when the client postprocesses kern.fea (e.g. splitting out dist), as there would be no kern.fea to postprocess.
+        """
+        if not self.options["build_kern_lookups_directly"]:
+            return False
+        if hasattr(kit.FeatureKern, "postprocess"):
+            if not self._warned_about_kern_postprocessing:
+                print("[WARNING] `FeatureKern.postprocess` is defined, so kern.fea is written instead of building kern lookups directly.")
+                self._warned_about_kern_postprocessing = True
+            return False
+        return True
+
+    def prepare_features_for_style(self, style):
+
+        features_references = kit.FeatureReferences(self, style=style)
+        features_references._extension = ""
+
+        if self.options["prepare_kerning"]:
+            feature_kern = kit.FeatureKern(self, style=style)
+            if self.is_building_kern_lookups_directly():
+                for path in feature_kern.get_cache_outputs():
+                    kit.remove(path)
+            else:
+                feature_kern.prepare()
+        if self.options["prepare_mark_positioning"]:
+            feature_mark = kit.FeatureMark(self, style=style)
+            if self.options["build_mark_lookups_directly"]:
+                for path in feature_mark.get_cache_outputs():
+                    kit.remove(path)
+            else:
+                feature_mark.prepare()
+        if self.options["match_mI_variants"]:
+            kit.FeatureMatches(self, style=style).prepare()
+        kit.FeatureOS2Extension(self, style=style).prepare()
+        kit.FeatureNameExtension(self, style=style).prepare()
+        features_references.prepare()
+
+    def get_style_feature_paths(self, style):
+        """
+        :return: Paths of the feature files prepared for `style`: its features file, which includes the others, and those that exist of the others.
+        """
+        directory = style.get_directory()
+        paths = [os.path.join(directory, "features")]
+        paths.extend(sorted(glob.glob(os.path.join(directory, "*.fea"))))
+        mark_positioning_path = kit.FeatureMatches.get_mark_positioning_path(style)
+        if os.path.exists(mark_positioning_path):
+            paths.append(mark_positioning_path)
+        return paths
+
+    def get_feature_paths(self, style):
+        """
+        :return: Paths of the feature files compiled into the products of `style`: its own, and the directory of the shared ones.
+        """
+        return self.get_style_feature_paths(style) + [kit.Project.temp(kit.Project.directories["features"])]
+
+    def generate_products(self, style):
+        """
+        Products of the same style modify the same intermediate UFO, so they are generated in order.
+        :return: Which of them were built.
+        """
+        products = [i for i in self.products if i.style is style]
+        for product in products:
+            product.generate()
+        return [i.built for i in products]
+
+    def merge_products(self, style, built):
+        """Apply what `generate_products` returned from a worker process. None if the products were up to date."""
+        products = [i for i in self.products if i.style is style]
+        for product, is_built in zip(products, kit.fallback(built, [True] * len(products))):
+            product.built = is_built
+
+    def get_tasks(self):
+        """
+        The build as a graph of tasks: one per master, one for the designspace, one per style, one for the shared features, one per style for its own features, one for the FontMenuNameDB, and one per style for its products.
+        """
+
+        tasks = []
+        styles = self.family.get_instance_styles()
+        goadb_path = kit.Project.directories["GOADB"]
+
+        tasks_masters = []
         if self.options["prepare_masters"]:
-
-            # self.reset_directory("masters", temp=True)
-
-            for master in self.family.masters:
-                master.prepare()
-                if hasattr(master, "postprocess"):
-                    master.postprocess()
-                    master.refresh_groups()
-
             for master in self.family.masters:
-                master.save()
-
+                tasks_masters.append(kit.Task(
+                    "master " + master.name,
+                    functools.partial(self.prepare_master, master),
+                    inputs = [master.get_path(temp=False)],
+                    outputs = functools.partial(lambda master: [master.get_path()], master),
+                    fonts = [master],
+                    stage = "prepare_masters",
+                ))
+            tasks.extend(tasks_masters)
+
+        style_to_task_style = {}
         if self.options["prepare_styles"]:
+            task_designspace = None
+            if self.options["run_makeinstances"]:
+                task_designspace = kit.Task(
+                    "designspace",
+                    self.family.prepare_designspace,
+                    requires = tasks_masters,
+                    inputs = lambda: [i.write() for i in self.family.masters],
+                    outputs = [self.designspace.get_path()],
+                    stage = "prepare_styles",
+                )
+                tasks.append(task_designspace)
+            for style in styles:
+                style_to_task_style[style.name] = kit.Task(
+                    "style " + style.name,
+                    functools.partial(self.family.prepare_style, style),
+                    requires = tasks_masters + [task_designspace],
+                    inputs = functools.partial(self.family.get_style_inputs, style),
+                    outputs = functools.partial(lambda style: [style.get_path()], style),
+                    fonts = [style],
+                    stage = "prepare_styles",
+                    # mutatorMath interpolates in Python:
+                    fork = (
+                        self.options["run_makeinstances"] and
+                        self.options["generate_instances_in_process"] and
+                        not self.options["use_numpy_interpolation"] and
+                        not self.options["keep_fonts_in_memory"]
+                    ),
+                )
+            tasks.extend(style_to_task_style.values())
 
-            # self.reset_directory("styles", temp=True)
-
-            self.family.prepare_styles()
-
+        task_features = None
+        style_to_task_features = {}
         if self.options["prepare_features"]:
-
-            # self.reset_directory("features", temp=True)
-
-            if self.family.styles[0].file_format == "UFO":
-                reference_font = self.products[0].style.open()
-                self.family.info.unitsPerEm = reference_font.info.unitsPerEm
-            elif self.family.styles[0].file_format == "OTF":
-                reference_font = fontTools.ttLib.TTFont(self.products[0].style.get_path())
-                self.family.info.unitsPerEm = reference_font["head"].unitsPerEm
-
-            self.feature_classes = kit.FeatureClasses(self)
-            self.feature_tables = kit.FeatureTables(self)
-            self.feature_languagesystems = kit.FeatureLanguagesystems(self)
-            self.feature_gsub = kit.FeatureGSUB(self)
-            self.feature_gpos = kit.FeatureGPOS(self)
-
-            self.feature_classes.prepare()
-            self.feature_tables.prepare()
-            self.feature_languagesystems.prepare()
-            self.feature_gsub.prepare()
-            self.feature_gpos.prepare()
-
-            for product in (i for i in self.products if i.file_format == "OTF"):
-
-                self.feature_kern = kit.FeatureKern(self, style=product.style)
-                self.feature_mark = kit.FeatureMark(self, style=product.style)
-                self.feature_matches = kit.FeatureMatches(self, style=product.style)
-                self.feature_OS2_extension = kit.FeatureOS2Extension(self, style=product.style)
-                self.feature_name_extension = kit.FeatureNameExtension(self, style=product.style)
-                self.features_references = kit.FeatureReferences(self, style=product.style)
-                self.features_references._extension = ""
-
-                if self.options["prepare_kerning"]:
-                    self.feature_kern.prepare()
-                if self.options["prepare_mark_positioning"]:
-                    self.feature_mark.prepare()
-                if self.options["match_mI_variants"]:
-                    self.feature_matches.prepare()
-                self.feature_OS2_extension.prepare()
-                self.feature_name_extension.prepare()
-                self.features_references.prepare()
+            self.set_up_features()
+            task_features = kit.Task(
+                "features",
+                self.prepare_features,
+                requires = list(style_to_task_style.values()),
+                inputs = lambda: (
+                    [i.write() for i in styles] +
+                    [goadb_path] +
+                    [j.get_path(temp=False) for i in self.get_shared_features() for j in i.file_group]
+                ),
+                outputs = [kit.Project.temp(kit.Project.directories["features"])],
+                stage = "prepare_features",
+            )
+            tasks.append(task_features)
+            for style in (i.style for i in self.products if i.file_format == "OTF"):
+                style_to_task_features[style.name] = kit.Task(
+                    "features " + style.name,
+                    functools.partial(self.prepare_features_for_style, style),
+                    requires = [task_features],
+                    inputs = functools.partial(
+                        lambda style: [style.write(), goadb_path, kit.Project.temp(kit.Project.directories["features"])],
+                        style,
+                    ),
+                    outputs = functools.partial(self.get_style_feature_paths, style),
+                    stage = "prepare_features",
+                    # KernDataClass and matching mI variants are Python:
+                    fork = True,
+                )
+            tasks.extend(style_to_task_features.values())
 
         if self.options["compile"]:
+            task_fmndb = kit.Task(
+                "FontMenuNameDB",
+                self.fmndb.prepare,
+                inputs = [self.fmndb.get_path(temp=False)],
+                outputs = [self.fmndb.get_path()],
+                stage = "compile",
+            )
+            tasks.append(task_fmndb)
+            for style in styles:
+                tasks.append(kit.Task(
+                    "products " + style.name,
+                    functools.partial(self.generate_products, style),
+                    requires = [
+                        task_fmndb,
+                        kit.fallback(
+                            style_to_task_features.get(style.name),
+                            task_features,
+                            style_to_task_style.get(style.name),
+                        ),
+                    ],
+                    inputs = functools.partial(
+                        lambda style: (
+                            [style.write()] +
+                            self.get_feature_paths(style) +
+                            [goadb_path, self.fmndb.get_path()]
+                        ),
+                        style,
+                    ),
+                    outputs = [i.get_path(temp=False) for i in self.products if i.style is style],
+                    stage = "compile",
+                    # normalizeUFO, ufo2ft and building GPOS are Python:
+                    fork = True,
+                    merge = functools.partial(self.merge_products, style),
+                ))
+
+        return tasks
+
+    def build(self):
+        with self.instrumentation.measure("build", kind="build"):
+            self._build()
+        self.instrumentation.write_report()
 
-            # self.reset_directory("products", temp=True)
+    def _build(self):
 
-            self.fmndb.prepare()
+        if self.options["incremental"]:
+            stamp_directory = kit.Project.temp("stamps")
+            get_key = (self.cache or kit.BuildCache(self)).get_key
+        else:
+            self.reset_directory("intermediates")
+            stamp_directory = None
+            get_key = None
+
+        self.scheduler = kit.Scheduler(
+            self.get_tasks(),
+            max_workers = self.options["max_workers"],
+            instrumentation = self.instrumentation,
+            stamp_directory = stamp_directory,
+            get_key = get_key,
+        )
+        self.scheduler.run()
 
-            for product in self.products:
-                product.generate()
+        products_built = [i for i in self.products if i.built]
+        for product in self.products:
+            print("[BUILT]" if product.built else "[NOT BUILT]", product.get_path(temp=False))
 
-            products_built = [i for i in self.products if i.built]
+        if self.cache:
+            print("[BUILD CACHE] {} restored, {} rebuilt".format(self.cache.hits, self.cache.misses))
 
         client_data = self.family.get_client_data()
 
@@ -324,9 +545,9 @@ class Project(object):
                 )
                 archive_path = os.path.join(self.directories["products"], archive_filename)
                 kit.remove(archive_path)
-                subprocess.call(["zip", "-j", archive_path] + paths)
+                self.instrumentation.call(["zip", "-j", archive_path] + paths, outputs=[archive_path])
                 print("[ZIPPED]", archive_path)
-                subprocess.call(["ttx", "-fq"] + paths)
+                self.instrumentation.call(["ttx", "-fq"] + paths)
                 print("[TTX DUMPED]")
                 for path in paths:
                     kit.remove(path)
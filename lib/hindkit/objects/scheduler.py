@@ -0,0 +1,281 @@
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import traceback
+
+import hindkit as kit
+
+
+class Task(object):
+
+    # What the path of a saved font is derived from:
+    FONT_ATTRIBUTES = ["file_format", "_filename", "counter"]
+
+    def __init__(
+        self,
+        name,
+        action,
+        requires = None,
+        inputs = None,
+        outputs = None,
+        stage = None,
+        fonts = None,
+        fork = False,
+        merge = None,
+    ):
+        """
+        :param action: Callable doing the work.
+        :param requires: Tasks that must finish before this one starts.
+        :param inputs: Paths the outputs are derived from, or a callable returning them.
+        :param outputs: Paths the task writes, or a callable returning them. Without outputs, the task always runs.
+        :param stage: Name of the build stage the task belongs to.
+        :param fonts: Fonts the action saves. Where they were saved is kept with the stamp, so when the task is skipped they still point to the same files.
+        :param fork: Run the action in a forked process when running in parallel, for GIL-bound work. Where `fonts` were saved is sent back, anything else the action changes in memory is lost, so it should return what the build process needs.
+        :param merge: Callable applying the return value of a forked action in the build process. Called with None when the task is skipped.
+        """
+        self.name = name
+        self.action = action
+        self.requires = [i for i in kit.fallback(requires, []) if i is not None]
+        self.inputs = kit.fallback(inputs, [])
+        self.outputs = kit.fallback(outputs, [])
+        self.stage = stage
+        self.fonts = kit.fallback(fonts, [])
+        self.fork = fork
+        self.merge = merge
+        self.skipped = False
+        self.result = None
+
+    @staticmethod
+    def _resolve(paths):
+        if callable(paths):
+            paths = paths()
+        return list(paths)
+
+    def get_inputs(self):
+        return self._resolve(self.inputs)
+
+    def get_outputs(self):
+        return self._resolve(self.outputs)
+
+    def get_font_states(self):
+        return [[getattr(font, i) for i in self.FONT_ATTRIBUTES] for font in self.fonts]
+
+    def set_font_states(self, states):
+        for font, state in zip(self.fonts, states):
+            for attribute, value in zip(self.FONT_ATTRIBUTES, state):
+                setattr(font, attribute, value)
+            font.defconFont = None
+
+    def run(self):
+        return self.action()
+
+    def __repr__(self):
+        return "<Task {}>".format(self.name)
+
+
+def _run_forked(scheduler, task, connection):
+    """In the forked process: run `task` and send back its outcome, its instrumentation records and where its fonts were saved."""
+    instrumentation = scheduler.instrumentation
+    record_count = len(instrumentation.records) if instrumentation else 0
+    try:
+        outcome = [True, scheduler._run(task)]
+    except BaseException as e:
+        if not isinstance(e, SystemExit):
+            traceback.print_exc()
+        outcome = [False, e]
+    records = instrumentation.records[record_count:] if instrumentation else []
+    font_states = task.get_font_states()
+    try:
+        connection.send(outcome + [records, font_states])
+    except Exception:  # Not picklable.
+        connection.send([False, RuntimeError("[TASK FAILED] {}".format(outcome[1])), records, font_states])
+    connection.close()
+
+
+class Scheduler(object):
+    """
+    Runs tasks once their required tasks have finished, up to `max_workers` at a time. Tasks run in threads, which is enough to overlap subprocesses (makeotf) and C code with other tasks, except forking tasks, which run in processes so their Python code (normalizeUFO, ufo2ft, building GPOS) runs in parallel too. To fork only the scheduling thread, processes are only forked while no threaded task is running.
+
+    With a stamp directory, a task with outputs is skipped if its outputs exist and the digest of its inputs (their content, plus the options, tools and code, see `kit.BuildCache.get_key`) is the one stamped when it last ran. Outputs of a task that runs again are removed first.
+    """
+
+    def __init__(
+        self,
+        tasks,
+        max_workers = 1,
+        instrumentation = None,
+        stamp_directory = None,
+        get_key = None,
+    ):
+        """
+        :param stamp_directory: Where digests of the inputs of tasks are kept between builds. None to always run tasks.
+        :param get_key: Callable returning a digest of a name and paths, e.g. `kit.BuildCache.get_key`.
+        """
+        self.tasks = list(tasks)
+        self.max_workers = kit.fallback(max_workers, os.cpu_count())
+        self.instrumentation = instrumentation
+        self.stamp_directory = stamp_directory
+        self.get_key = get_key
+        self.can_fork = "fork" in multiprocessing.get_all_start_methods()
+        self.done = set()
+        self._task_to_inputs = {}
+
+    def _get_stamp_path(self, task):
+        filename = hashlib.sha1(task.name.encode()).hexdigest() + ".json"
+        return os.path.join(self.stamp_directory, filename)
+
+    def _read_stamp(self, task):
+        try:
+            with open(self._get_stamp_path(task)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_stamp(self, task):
+        """After `task` ran: stamp the digest of the inputs it read, what it wrote, and where its fonts are."""
+        stamp = {
+            "digest": self.get_key("task " + task.name, self._task_to_inputs.pop(task)),
+            "outputs": task.get_outputs(),
+            "fonts": task.get_font_states(),
+        }
+        kit.makedirs(self.stamp_directory)
+        path = self._get_stamp_path(task)
+        with open(path + ".tmp", "w") as f:
+            json.dump(stamp, f)
+        os.replace(path + ".tmp", path)
+
+    def is_up_to_date(self, task):
+        if not self.stamp_directory or not task.outputs:
+            return False
+        stamp = self._read_stamp(task)
+        if stamp is None or not all(os.path.exists(i) for i in stamp["outputs"]):
+            return False
+        if stamp["digest"] != self.get_key("task " + task.name, task.get_inputs()):
+            return False
+        task.set_font_states(stamp["fonts"])
+        return True
+
+    def _run(self, task):
+        if self.instrumentation:
+            with self.instrumentation.measure(
+                task.name,
+                stage = task.stage,
+                outputs = task.get_outputs if task.outputs else None,
+            ):
+                return task.run()
+        else:
+            return task.run()
+
+    def _wait_for_fork(self, process, connection):
+        try:
+            succeeded, value, records, font_states = connection.recv()
+        except EOFError:
+            process.join()
+            raise RuntimeError("[WORKER PROCESS EXITED] exit code {}".format(process.exitcode))
+        finally:
+            connection.close()
+        process.join()
+        if self.instrumentation:
+            self.instrumentation.add_records(records)
+        if not succeeded:
+            raise value
+        return value, font_states
+
+    def _start(self, task, executor):
+        if self.is_up_to_date(task):
+            task.skipped = True
+            if task.merge:
+                task.merge(None)
+            print("[UP TO DATE]", task.name)
+            return None
+        if self.stamp_directory and task.outputs:
+            self._task_to_inputs[task] = task.get_inputs()
+            for path in task.get_outputs():
+                kit.remove(path)
+        print("[STARTED]", task.name)
+        if executor is None:
+            task.result = self._run(task)
+            return None
+        if task.fork and self.can_fork:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.get_context("fork").Process(
+                target = _run_forked,
+                args = (self, task, sender),
+            )
+            process.start()
+            sender.close()
+            return executor.submit(self._wait_for_fork, process, receiver)
+        return executor.submit(self._run, task)
+
+    def _finish(self, task):
+        if task in self._task_to_inputs:
+            self._write_stamp(task)
+        self.done.add(task)
+
+    def _is_forking(self, task):
+        return task.fork and self.can_fork
+
+    def run(self):
+
+        tasks = [i for i in self.tasks if i not in self.done]
+        task_set = set(tasks)
+        for task in tasks:
+            for required in task.requires:
+                if required not in task_set and required not in self.done:
+                    raise ValueError("[TASK MISSING] {} requires {}".format(task, required))
+
+        executor = None
+        if self.max_workers > 1:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+
+        pending = list(tasks)
+        running = {}
+        try:
+            while pending or running:
+                started = True
+                while started:
+                    started = False
+                    # Forking tasks first, as they can't start once a threaded task is running:
+                    ready = sorted(
+                        (i for i in pending if all(j in self.done for j in i.requires)),
+                        key = lambda i: not self._is_forking(i),
+                    )
+                    for task in ready:
+                        if len(running) >= self.max_workers:
+                            break
+                        if self._is_forking(task) and executor and any(
+                            not self._is_forking(i) for i in running.values()
+                        ):
+                            continue
+                        pending.remove(task)
+                        future = self._start(task, executor)
+                        if future is None:
+                            self._finish(task)
+                            started = True
+                        else:
+                            running[future] = task
+                if not running:
+                    if pending:
+                        raise ValueError("[CIRCULAR TASK DEPENDENCIES] " + ", ".join(i.name for i in pending))
+                    break
+                finished, _ = concurrent.futures.wait(
+                    running,
+                    return_when = concurrent.futures.FIRST_COMPLETED,
+                )
+                for future in finished:
+                    task = running.pop(future)
+                    if self._is_forking(task):
+                        task.result, font_states = future.result()
+                        task.set_font_states(font_states)
+                        if task.merge:
+                            task.merge(task.result)
+                    else:
+                        task.result = future.result()
+                    self._finish(task)
+        finally:
+            if executor:
+                for future in running:
+                    future.cancel()
+                executor.shutdown(wait=True)
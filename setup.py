@@ -1,4 +1,16 @@
+import os, sys
 import setuptools
+from setuptools.command.build_py import build_py
+
+class BuildPyWithDataIndexes(build_py):
+    """Also compile the indexes of the bundled data tables, so they are shipped instead of compiled on first use."""
+    def run(self):
+        super().run()
+        if not self.dry_run:
+            sys.path.insert(0, os.path.abspath("lib"))
+            from hindkit import dataindex
+            dataindex.compile_all(os.path.join(self.build_lib, "hindkit", "data", "index"))
+
 setuptools.setup(
     name = "hindkit",
     version = "1.0.0",
@@ -19,8 +31,12 @@ setuptools.setup(
     package_data = {
         "hindkit": [
             "data/*.txt",
+            "data/index/*.idx",
             "data/premade/*/GlyphOrderAndAliasDB",
             "data/premade/*/features/*.fea",
         ],
     },
+    cmdclass = {
+        "build_py": BuildPyWithDataIndexes,
+    },
 )